@@ -255,6 +255,7 @@ def btn_next(s, r, active=True):
 
 # ================= Entities =================
 class Note:
+    __slots__ = ("x","lane","y","hit","missed")
     def __init__(self, x, lane, y):
         self.x=x; self.lane=lane; self.y=y
         self.hit=False; self.missed=False
@@ -265,6 +266,7 @@ class Note:
     def draw(self, s): draw_note(s, self.x, self.y, self.missed)
 
 class Duck:
+    __slots__ = ("lanes","idx","y","mouth")
     def __init__(self, laneYs):
         self.lanes=laneYs; self.idx=min(1,len(laneYs)-1)
         self.y=self.lanes[self.idx]; self.mouth=0.0
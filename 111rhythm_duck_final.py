@@ -1,4 +1,8 @@
-import sys, math, os, subprocess, time
+import sys, math, os, subprocess, time, gc, tracemalloc, sqlite3, threading, queue
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 import pygame
 import numpy as np
 
@@ -24,9 +28,17 @@ HIT_X    = 40
 NOTE_SPD = 70
 NOTE_H   = 5
 LANE_THK = NOTE_H + 2
+HOLD_THK = NOTE_H - 2    # hold note body, thinner than the head
 HIT_WIN  = 6
+HIT_WIN_T = HIT_WIN / NOTE_SPD   # the same window in seconds
 MOUTH_T  = 0.15
 
+# practice mode
+RATE_MIN   = 0.5    # slowest playback rate; -/= step it by RATE_STEP up to 1.0
+RATE_STEP  = 0.1
+SEEK_BEATS = 4      # Left/Right jump this many beats
+PRACTICE_LEAD = 1.5 # s of run-up before the beat a seek jumps to
+
 HP_SEGMENTS    = 10
 # A miss reduces 2 HP segments. We'll use miss_count (per-note misses).
 # Assumption: thresholds are mapped as follows (per your spec):
@@ -45,46 +57,235 @@ class GameConfig:
     def __init__(self):
         self.muted = False
         self.note_style = "sun"
+        self.theme = "day"          # "night" recolours the indexed canvas' palette
 
 GAME_CFG = GameConfig()
 
-def square_sound(freq=440, length=0.24, vol=1.0):
+# ---- Oscillators: band-limited wavetables ----
+class OscBank:
+    """
+    Wavetable oscillators for every synthesized tone. Each waveform is one
+    single cycle per octave band, built from only the harmonics that stay
+    below Nyquist at the band's top pitch, so high notes do not alias.
+    voice() reads the table with a 32-bit fixed-point phase accumulator (one
+    cycle = 2**32, so wrapping is free; top bits index the table, the rest
+    interpolate) and adds the result into a caller's buffer, one cache-sized
+    block at a time through work arrays allocated once. Voices simply add up,
+    so chords and accompaniment are several voice() calls on one buffer.
+    Waves: "square", "triangle", "pulse25", "pulse12" (pulse width 25% / 12.5%).
+    """
+    TABLE_BITS = 11
+    TABLE_N = 1 << TABLE_BITS
+    LOW = 20.0     # band b covers pitches up to LOW * 2**(b+1)
+    BANDS = 11
+    BLOCK = 16384  # samples rendered per pass
+
+    def __init__(self, sr=SR):
+        self.sr = sr
+        self.tables = {
+            "square": self._build(lambda k: self._pulse(k, 0.5)),
+            "triangle": self._build(self._triangle),
+            "pulse25": self._build(lambda k: self._pulse(k, 0.25)),
+            "pulse12": self._build(lambda k: self._pulse(k, 0.125)),
+        }
+        self._work = {}
+        self._local = threading.local()   # level prefetch synthesizes off the main thread
+
+    @staticmethod
+    def _pulse(k, w):
+        # +1 for the first w of the cycle, -1 after (DC removed): cos and sin terms
+        c = 2/(np.pi*k)
+        return c*np.sin(2*np.pi*k*w), c*(1 - np.cos(2*np.pi*k*w))
+
+    @staticmethod
+    def _triangle(k):
+        odd = k % 2 == 1
+        b = np.where(odd, 8/(np.pi**2 * k**2) * np.where((k//2) % 2 == 0, 1, -1), 0.0)
+        return np.zeros_like(b), b
+
+    def _build(self, harmonics):
+        N = self.TABLE_N
+        k = np.arange(1, N//2)
+        a, b = harmonics(k)
+        cyc = np.empty((self.BANDS, N), np.float32)
+        for band in range(self.BANDS):
+            top = int(self.sr/2 // (self.LOW * 2**(band+1)))
+            spec = np.zeros(N//2+1, np.complex128)
+            spec[1:N//2] = np.where(k <= top, (a - 1j*b) * N/2, 0)
+            cyc[band] = np.fft.irfft(spec, N)
+        cyc /= np.abs(cyc).max()
+        # (sample, slope to the next sample) per band, for the interpolation
+        return cyc, np.roll(cyc, -1, axis=1) - cyc
+
+    def table(self, wave, freq):
+        """(samples, slopes) of the band that holds freq."""
+        band = math.ceil(math.log2(max(freq, self.LOW) / self.LOW)) - 1
+        cyc, slope = self.tables[wave]
+        band = min(max(band, 0), self.BANDS-1)
+        return cyc[band], slope[band]
+
+    def _ramps(self, a, r):
+        # attack / release envelope segments, shared by every note of that shape
+        env = self._work.get((a, r))
+        if env is None:
+            env = self._work[(a, r)] = (np.linspace(0, 1, a, endpoint=False, dtype=np.float32),
+                                        np.linspace(1, 0.001, r, dtype=np.float32))
+        return env
+
+    def _block(self):
+        w = getattr(self._local, "block", None)
+        if w is None:
+            B = self.BLOCK
+            w = self._local.block = (np.arange(B, dtype=np.uint32), np.empty(B, np.uint32), np.empty(B, np.uint32),
+                                     np.empty(B, np.float32), np.empty(B, np.float32), np.empty(B, np.float32))
+        return w
+
+    def voice(self, wave, freq, out, gain=1.0, attack=0.006, release=0.04, phase=0, start=0, length=None):
+        """
+        Add one note of `wave` at `freq` into the float32 buffer `out`, with a
+        linear attack and a release to 0.001. The note is `length` samples long
+        (default len(out)) and out receives its samples from `start` on, so a
+        note can be rendered piecewise. Returns the phase after the rendered
+        part, to continue a voice seamlessly into the next buffer.
+        """
+        n = len(out)
+        note = n if length is None else length
+        frac_bits = 32 - self.TABLE_BITS
+        cyc, slope = self.table(wave, freq)
+        inc = int(round(freq / self.sr * 2**32)) & 0xFFFFFFFF
+        a = min(int(attack*self.sr), note); r = min(int(release*self.sr), note)
+        up, down = self._ramps(a, r)
+        ramp, ph, idx, y, dy, frac = self._block()
+        phase = (phase + start*inc) & 0xFFFFFFFF
+        # block by block, so the work arrays stay in cache for long notes
+        for b0 in range(0, n, self.BLOCK):
+            m = min(self.BLOCK, n - b0)
+            if m < self.BLOCK:
+                ph, idx, y, dy, frac = ph[:m], idx[:m], y[:m], dy[:m], frac[:m]
+            np.multiply(ramp[:m], np.uint32(inc), out=ph)   # wraps mod 2**32 = whole cycles
+            ph += np.uint32((phase + b0*inc) & 0xFFFFFFFF)
+            np.right_shift(ph, np.uint32(frac_bits), out=idx)
+            np.take(cyc, idx, out=y)
+            np.take(slope, idx, out=dy)
+            ph &= np.uint32((1 << frac_bits) - 1)
+            np.copyto(frac, ph, casting='unsafe')
+            frac *= np.float32(1 / (1 << frac_bits))
+            dy *= frac
+            y += dy
+            y *= np.float32(gain)
+            pos = start + b0                                # position in the note
+            if pos < a:
+                y[:a-pos] *= up[pos:pos+m]
+            if pos+m > note-r:
+                s0 = max(pos, note-r)
+                y[s0-pos:] *= down[s0-(note-r):pos+m-(note-r)]
+            out[b0:b0+m] += y
+        return (phase + n*inc) & 0xFFFFFFFF
+
+OSC = OscBank()
+
+# ---- Sound buffers ----
+# SDL_mixer keeps its own copy of every Sound, in the device format. Sounds
+# are created silent and synthesized straight into that copy (through the
+# buffer protocol), so it is the only full-length buffer ever allocated.
+_ZEROS = b""    # shared silence the mixer copies new Sounds from; only ever replaced, never resized
+
+def blank_sound(frames):
+    """Silent Sound of `frames` frames in the mixer format; fill it through sound_pcm()."""
+    global _ZEROS
+    fmt = pygame.mixer.get_init()
+    if fmt is None:
+        # every synthesized Sound comes through here; fail as pygame itself would
+        raise pygame.error("mixer not initialized: sounds are synthesized in the mixer format")
+    _, bits, nch = fmt
+    size = frames * nch * (abs(bits)//8)
+    zeros = _ZEROS
+    if len(zeros) < size:
+        zeros = _ZEROS = bytes(max(size, 2*len(zeros)))
+    return pygame.mixer.Sound(buffer=memoryview(zeros)[:size])
+
+def sound_pcm(snd):
+    """The Sound's own samples as a writable (frames, channels) array."""
+    a = pygame.sndarray.samples(snd)
+    return a.reshape(len(a), -1)
+
+def write_pcm(dst, x):
+    """Write float samples in [-1, 1], (n,) mono or (n, channels), into a sound_pcm() slice.
+    x is clipped and scaled in place."""
+    np.clip(x, -1.0, 1.0, out=x)
+    if dst.dtype.kind != 'f':
+        info = np.iinfo(dst.dtype)
+        half = (int(info.max) - int(info.min) + 1) // 2
+        x *= half - 1
+        x += info.min + half        # 0 for signed formats, mid-scale for unsigned ones
+    dst[:] = x[:, None] if x.ndim == 1 else x
+
+def synth_sound(frames, notes):
+    """
+    Sound of `frames` frames holding `notes`: (wave, freq, start, length, gain),
+    positions in frames. Mixed one OscBank block at a time and written once
+    into the Sound; every channel gets the same (mono) signal.
+    """
+    snd = blank_sound(frames)
+    pcm = sound_pcm(snd)
+    B = OscBank.BLOCK
+    buf = np.empty(min(B, frames), np.float32)
+    for b0 in range(0, frames, B):
+        m = min(B, frames-b0); out = buf[:m]; out[:] = 0
+        for wave, freq, at, length, gain in notes:
+            s0, s1 = max(at, b0), min(at+length, b0+m)
+            if s0 < s1:
+                OSC.voice(wave, freq, out[s0-b0:s1-b0], gain, start=s0-at, length=length)
+        write_pcm(pcm[b0:b0+m], out)
+    return snd
+
+def mixer_channels(levels):
+    """
+    1 unless a level streams a stereo song: every synthesized sound is mono,
+    and a mono mixer stores each Sound at half the size of a stereo one.
+    """
+    for lv in levels:
+        song = lv.get("song")
+        if song and read_wav(song["path"])[0].shape[1] > 1:
+            return 2
+    return 1
+
+def square_sound(freq=440, length=0.24, vol=1.0, wave="square"):
     n = int(length*SR)
-    t = np.linspace(0,length,n,endpoint=False)
-    w = np.sign(np.sin(2*np.pi*freq*t)).astype(np.float32)
-    a = int(0.006*SR); r=int(0.04*SR)
-    env = np.ones(n, np.float32)
-    if a>0: env[:a]=np.linspace(0,1,a,endpoint=False)
-    if r>0: env[-r:]=np.linspace(1,0.001,r)
-    w*=env*vol
-    arr=(w*32767).astype(np.int16)
-    return pygame.sndarray.make_sound(np.stack([arr,arr],axis=1))
+    return synth_sound(n, [(wave, freq, 0, n, vol)])
 
 def noise_click(length=0.06, vol=0.45):
-    n=int(length*SR); w=(np.random.randn(n).astype(np.float32))
-    env=np.linspace(1,0.001,n)
-    arr=(w*env*vol*32767).astype(np.int16)
-    return pygame.sndarray.make_sound(np.stack([arr,arr],axis=1))
+    n=int(length*SR)
+    w=np.random.randn(n).astype(np.float32)
+    w*=np.linspace(vol,0.001*vol,n,dtype=np.float32)
+    snd=blank_sound(n); write_pcm(sound_pcm(snd), w)
+    return snd
 
 def midi_to_hz(m): return 440.0*(2**((m-69)/12))
 def bg_song_twinkle(bpm=100):
     notes=[60,60,67,67,69,69,67, 65,65,64,64,62,62,60]
     lens =[1]*6+[2] + [1]*6+[2]
+    bass =[48,48,48,48,53,53,48, 53,53,48,48,43,43,48]   # I I IV I / IV I V I
     beat=60.0/bpm
-    parts=[]
-    for m,l in zip(notes,lens):
-        d=l*beat; n=int(d*SR); t=np.linspace(0,d,n,endpoint=False)
-        w=np.sign(np.sin(2*np.pi*midi_to_hz(m)*t)).astype(np.float32)
-        a=int(0.006*SR); r=int(0.04*SR)
-        env=np.ones(n,np.float32)
-        if a>0: env[:a]=np.linspace(0,1,a,endpoint=False)
-        if r>0: env[-r:]=np.linspace(1,0.001,r)
-        parts.append(w*env*0.35)
-    mono=np.concatenate(parts)
-    arr=(mono*32767).astype(np.int16)
-    return pygame.sndarray.make_sound(np.stack([arr,arr],axis=1))
+    parts=[]; at=0
+    for m,b,l in zip(notes,bass,lens):
+        n=int(l*beat*SR)
+        parts.append(("square", midi_to_hz(m), at, n, 0.35))
+        parts.append(("triangle", midi_to_hz(b), at, n, 0.2))
+        at+=n
+    return synth_sound(at, parts)
 
 LANE_FREQS = [261.63, 329.63, 392.00]
+MAJOR_SCALE = [0, 2, 4, 5, 7, 9, 11]   # semitones of each scale degree
+
+def lane_freqs(n):
+    """Tone per lane: LANE_FREQS (C4 E4 G4 = degrees 1/3/5), then further up the
+    C major scale in thirds (B4, D5, F5, ...), so any lane count gets a distinct pitch."""
+    out = list(LANE_FREQS[:n])
+    for i in range(len(out), n):
+        d = 2*i
+        out.append(midi_to_hz(60 + 12*(d//7) + MAJOR_SCALE[d % 7]))
+    return out
 
 # ---- Levels (no same-tick multi-lane) ----
 LEVELS = [
@@ -105,10 +306,20 @@ LEVELS = [
 # ================= Pixel helpers =================
 def px_rect(s, x,y,w,h,c): s.fill(c, pygame.Rect(x,y,w,h))
 
+# SysFont scans the system font list on every call; keep one object per face/size
+_FONT_CACHE = {}
+def sys_font(name, size, bold=True):
+    key = (name, size, bold)
+    f = _FONT_CACHE.get(key)
+    if f is None:
+        f = _FONT_CACHE[key] = pygame.font.SysFont(name, size, bold=bold)
+    return f
+
 def px_text(s, text, x, y, color=C_INFO, size=12, outline=False):
     # tiny crisp monospace; render ONLY on pixel canvas, antialias=False
     # use a slightly larger monospaced font to ensure visibility after scaling
     # robust font rendering: try multiple fonts and verify rendered surface is non-empty
+    aa = s.get_bitsize() > 8      # no blending on the indexed canvas: only palette colours
     def render_with_fallback(t, size=12, bold=True, color=color):
         has_cjk = any('\u4e00' <= ch <= '\u9fff' for ch in t)
         # candidate font names (macOS common + generic fallbacks)
@@ -119,21 +330,21 @@ def px_text(s, text, x, y, color=C_INFO, size=12, outline=False):
             candidates = ["Courier New", "Menlo", None]
         for name in candidates:
             try:
-                f = pygame.font.SysFont(name, size, bold=bold)
+                f = sys_font(name, size, bold=bold)
             except Exception:
                 try:
-                    f = pygame.font.SysFont(None, size, bold=bold)
+                    f = sys_font(None, size, bold=bold)
                 except Exception:
                     continue
             try:
-                img = f.render(t, True, color)
+                img = f.render(t, aa, color)
             except Exception:
                 continue
             # ensure rendered image is not empty (some fonts may produce blank glyphs)
             if img.get_bounding_rect().width > 0:
                 return img
         # last resort: default font render (may be empty)
-        return pygame.font.SysFont(None, size, bold=bold).render(t, True, color)
+        return sys_font(None, size, bold=bold).render(t, aa, color)
 
     if outline:
         shadow = render_with_fallback(text, size=size, color=(10,10,10))
@@ -144,6 +355,7 @@ def px_text(s, text, x, y, color=C_INFO, size=12, outline=False):
 def px_text_center(s, text, cx, cy, color=C_INFO, size=12, outline=False):
     # render and center text on the pixel canvas
     # use the same robust renderer as px_text but centered
+    aa = s.get_bitsize() > 8
     def render_center_with_fallback(t, size=12, bold=True, color=color):
         has_cjk = any('\u4e00' <= ch <= '\u9fff' for ch in t)
         if has_cjk:
@@ -153,19 +365,19 @@ def px_text_center(s, text, cx, cy, color=C_INFO, size=12, outline=False):
             candidates = ["Courier New", "Menlo", None]
         for name in candidates:
             try:
-                f = pygame.font.SysFont(name, size, bold=bold)
+                f = sys_font(name, size, bold=bold)
             except Exception:
                 try:
-                    f = pygame.font.SysFont(None, size, bold=bold)
+                    f = sys_font(None, size, bold=bold)
                 except Exception:
                     continue
             try:
-                img = f.render(t, True, color)
+                img = f.render(t, aa, color)
             except Exception:
                 continue
             if img.get_bounding_rect().width > 0:
                 return img
-        return pygame.font.SysFont(None, size, bold=bold).render(t, True, color)
+        return sys_font(None, size, bold=bold).render(t, aa, color)
 
     if outline:
         shadow = render_center_with_fallback(text, size=size, color=(10,10,10))
@@ -180,11 +392,24 @@ def draw_bg(s, laneYs):
     px_rect(s, 0, PX_H-20, PX_W, 20, C_CITY)
     for y in laneYs:
         px_rect(s, 0, y-LANE_THK//2, PX_W, LANE_THK, C_LINE)
-    # draw a semi-transparent blue zone left of the hit line (50% alpha)
+    # semi-transparent blue zone left of the hit line (50% alpha), filled with
+    # the pre-blended colours so it also works on the indexed canvas
     zone_h = (laneYs[-1] - laneYs[0]) + 16
-    zone_surf = pygame.Surface((HIT_X, zone_h), pygame.SRCALPHA)
-    zone_surf.fill((60,110,155,128))
-    s.blit(zone_surf, (0, laneYs[0]-8))
+    px_rect(s, 0, laneYs[0]-8, HIT_X, zone_h, zone_over(C_BG))
+    for y in laneYs:
+        px_rect(s, 0, y-LANE_THK//2, HIT_X, LANE_THK, zone_over(C_LINE))
+
+C_ZONE = (60,110,155,128)
+_ZONE_CACHE = {}
+def zone_over(c):
+    """C_ZONE alpha-blended over colour c, exactly as SDL blends it."""
+    out = _ZONE_CACHE.get(c)
+    if out is None:
+        dst = pygame.Surface((1,1), 0, 32); dst.fill(c)
+        src = pygame.Surface((1,1), pygame.SRCALPHA, 32); src.fill(C_ZONE)
+        dst.blit(src, (0,0))
+        out = _ZONE_CACHE[c] = tuple(dst.get_at((0,0)))[:3]
+    return out
 
 # ---- Bigger pixel duck (~1.6x) ----
 def draw_duck(s, x, y, mouth=False):
@@ -264,18 +489,315 @@ def btn_next(s, r, active=True):
     pts = [(cx - size//4, cy - size//3), (cx - size//4, cy + size//3), (cx + size//3, cy)]
     pygame.draw.polygon(s, col, pts)
 
+# ---- HP column (right edge), filled bottom up ----
+HP_X, HP_Y = PX_W-12, PX_H-64
+HP_SEG_H, HP_GAP = 4, 2
+HP_RECT = pygame.Rect(HP_X-1, HP_Y-1, 6, (HP_SEGMENTS-1)*(HP_SEG_H+HP_GAP) + HP_SEG_H+2)
+def draw_hp(s, remain, low=(231,76,60)):
+    # `low` colours the last two segments, which flash
+    for i in range(HP_SEGMENTS):
+        y = HP_Y + (HP_SEGMENTS-1-i)*(HP_SEG_H+HP_GAP)
+        px_rect(s, HP_X-1, y-1, 6, HP_SEG_H+2, (210,210,210))
+        if i < remain:
+            col = (46,204,113) if remain>5 else (243,156,18) if remain>2 else low
+        else:
+            col = (180,180,180)
+        px_rect(s, HP_X, y, 4, HP_SEG_H, col)
+
+# ---- Chart editor cursor: a line across the lanes, a box on the edited lane ----
+def draw_edit_cursor(s, x, laneYs, lane):
+    top, bottom = laneYs[0]-NOTE_H, laneYs[-1]+NOTE_H
+    px_rect(s, x, top, 1, bottom-top+1, C_INFO)
+    y = laneYs[lane]
+    for r in ((x-3, y-3, 7, 1), (x-3, y+3, 7, 1), (x-3, y-3, 1, 7), (x+3, y-3, 1, 7)):
+        px_rect(s, *r, C_INFO)
+
+def level_rect(i):
+    # level select buttons, one per entry in LEVELS, three per row
+    return pygame.Rect(30 + (i % 3)*70, 48 + (i // 3)*38, 60, 20)
+
 # ================= Entities =================
 class Note:
-    def __init__(self, x, lane, y):
-        self.x=x; self.lane=lane; self.y=y
+    # position is not stored: NoteField computes every note's x from song time
+    __slots__ = ("idx","lane","y","hit_time","hit","missed")
+    def __init__(self, idx, lane, y, hit_time=0.0):
+        self.idx=idx; self.lane=lane; self.y=y; self.hit_time=hit_time
         self.hit=False; self.missed=False
-    def update(self, dt):
-        self.x -= NOTE_SPD*dt
-        if not self.hit and not self.missed and self.x < HIT_X - HIT_WIN:
-            self.missed=True
-    def draw(self, s): draw_note(s, self.x, self.y, self.missed)
+
+class NoteField:
+    """
+    Notes of the running level, kept per lane: a ring buffer (deque) of
+    on-screen notes ordered by hit time, fed from the level's NoteChart in
+    order of appearance. Each lane also has a judgement pointer: notes before
+    it are already hit or missed and only wait to scroll off, the note at it
+    is the only hit candidate. Hit and miss checks therefore touch O(1) notes
+    per lane per frame, however many notes are on screen.
+
+    x positions are not integrated: update(now) evaluates
+    x = HIT_X + speed * (scroll(hit_time) - scroll(now)) for every on-screen
+    note in one vectorized step (chart indices lo..next), so there is no drift.
+    Hold tails (xe) come from the same formula with the end time.
+
+    A hit hold note is sustained while the duck stays in its lane; the
+    per-lane hold_* lists hold that state and `sustaining` lists the lanes
+    with a live hold, so sustain() costs O(active holds) per frame.
+    """
+    __slots__ = ("ys","chart","next","lo","gone","xs","xe","active","judge",
+                 "hold_note","hold_next","sustaining")
+    def __init__(self, laneYs, chart=None):
+        """chart: the level's notes, see compile_chart()."""
+        self.ys = laneYs
+        self.chart = chart if chart is not None else NoteChart.empty()
+        self.next = self.lo = 0           # chart[lo:next] is spawned and not yet culled
+        self.gone = np.zeros(len(self.chart), bool)
+        self.xs = np.empty(len(self.chart))
+        self.xe = np.empty(len(self.chart)) if self.chart.has_holds else self.xs
+        self.active = [deque() for _ in laneYs]
+        self.judge = [0]*len(laneYs)
+        self.hold_note = [None]*len(laneYs)     # note being sustained in each lane
+        self.hold_next = [0.0]*len(laneYs)      # time of its next hold tick
+        self.sustaining = []
+
+    def __iter__(self):
+        return chain.from_iterable(self.active)
+
+    def __len__(self):
+        return sum(map(len, self.active))
+
+    def pending(self):
+        """True while anything is still to spawn or on screen."""
+        return self.next < len(self.chart) or any(self.active)
+
+    def spawn_due(self, t):
+        stop = int(np.searchsorted(self.chart.appear, t, side='right'))
+        for i in range(self.next, stop):
+            self._spawn(i)
+        self.next = max(self.next, stop)
+
+    def _spawn(self, i):
+        c = self.chart
+        lane = int(c.lane[i]); hit_time = float(c.hit[i])
+        n = Note(i, lane, self.ys[lane], hit_time)
+        q = self.active[lane]
+        if q and q[-1].hit_time > hit_time:
+            # a faster note overtook slower ones: keep the lane in hit order
+            k = len(q)
+            while k > self.judge[lane] and q[k-1].hit_time > hit_time:
+                k -= 1
+            q.insert(k, n)
+        else:
+            q.append(n)
+
+    def rechart(self, chart, now):
+        """
+        Switch to an edited version of the chart at song time `now` without
+        restarting. Chart entries before the first one that differs keep
+        their indices, so those notes are left alone. On-screen notes past it
+        are looked up in the new chart by (hit time, lane); the ones the edit
+        moved or removed are dropped, and new notes that should
+        already be on screen are spawned. Costs O(on-screen notes) plus a few
+        vectorized compares over the chart.
+        """
+        old = self.chart
+        m = min(len(old), len(chart))
+        same = ((old.appear[:m] == chart.appear[:m]) & (old.hit[:m] == chart.hit[:m])
+                & (old.lane[:m] == chart.lane[:m]) & (old.mult[:m] == chart.mult[:m])
+                & (old.end[:m] == chart.end[:m]) & (old.chord[:m] == chart.chord[:m]))
+        d = np.flatnonzero(~same)
+        j = int(d[0]) if len(d) else m
+        gone = np.zeros(len(chart), bool); gone[:j] = self.gone[:j]
+        self.chart, self.gone = chart, gone
+        self.xs = np.empty(len(chart))
+        self.xe = np.empty(len(chart)) if chart.has_holds else self.xs
+        if j >= self.next:
+            return        # nothing spawned yet is affected
+        stop = max(int(np.searchsorted(chart.appear, now, side='right')), j)
+        fresh = {(float(chart.hit[i]), int(chart.lane[i])): i for i in range(j, stop)}
+        for lane, q in enumerate(self.active):
+            keep = deque(); judged = 0
+            for k, n in enumerate(q):
+                if n.idx >= j:
+                    i = fresh.pop((n.hit_time, lane), None)
+                    if i is None:
+                        if self.hold_note[lane] is n:
+                            self.hold_note[lane] = None; self.sustaining.remove(lane)
+                        continue
+                    n.idx = i
+                judged += k < self.judge[lane]
+                keep.append(n)
+            self.active[lane] = keep; self.judge[lane] = judged
+        for i in sorted(fresh.values()):
+            self._spawn(i)
+        self.next = stop
+        lo = min(self.lo, j)
+        while lo < self.next and gone[lo]:
+            lo += 1
+        self.lo = lo
+
+    def update(self, now):
+        """Place every on-screen note for song time `now`."""
+        lo, hi = self.lo, self.next
+        if lo < hi:
+            c = self.chart; xs = self.xs[lo:hi]
+            p = c.scroll.pos(now)
+            np.subtract(c.phit[lo:hi], p, out=xs)
+            xs *= c.mult[lo:hi]
+            xs += HIT_X
+            if c.has_holds:
+                xe = self.xe[lo:hi]
+                np.subtract(c.pend[lo:hi], p, out=xe)
+                xe *= c.mult[lo:hi]
+                xe += HIT_X
+
+    def positions(self):
+        """(note, x, tail x) for every on-screen note; tail x == x for taps."""
+        xs, xe = self.xs, self.xe
+        for n in chain.from_iterable(self.active):
+            yield n, xs[n.idx], xe[n.idx]
+
+    def hit(self, lane, now):
+        """Judge the lane's next note as hit if it is inside the window; returns it or None.
+        A hit hold starts sustaining; the rest of a chord is cleared with it."""
+        q = self.active[lane]; i = self.judge[lane]
+        if i < len(q):
+            n = q[i]
+            if abs(n.hit_time - now) <= HIT_WIN_T:
+                n.hit = True
+                self.judge[lane] = i+1
+                c = self.chart
+                if c.end[n.idx] > n.hit_time:
+                    self._start_hold(lane, n)
+                if c.chord[n.idx] >= 0:
+                    self._clear_chord(lane, c.chord[n.idx])
+                return n
+        return None
+
+    def _start_hold(self, lane, n):
+        if self.hold_note[lane] is None:
+            self.sustaining.append(lane)
+        self.hold_note[lane] = n
+        self.hold_next[lane] = n.hit_time + self.chart.step[n.idx]
+
+    def _clear_chord(self, lane, cid):
+        # one duck can only be in one lane: eating any note of a chord eats all of it
+        chord = self.chart.chord
+        for l, q in enumerate(self.active):
+            j = self.judge[l]
+            if l != lane and j < len(q) and chord[q[j].idx] == cid:
+                q[j].hit = True
+                self.judge[l] = j+1
+
+    def sustain(self, lane, now):
+        """
+        Advance live holds to `now` with the duck in `lane`. Returns
+        (ticks scored, holds completed, holds dropped); leaving the lane drops
+        the hold, and its remaining ticks are lost.
+        """
+        ticks = done = dropped = 0
+        if not self.sustaining:
+            return ticks, done, dropped
+        c = self.chart
+        for l in list(self.sustaining):
+            n = self.hold_note[l]
+            end = c.end[n.idx]
+            if l != lane and now < end:
+                n.missed = True; dropped += 1
+            else:
+                step = c.step[n.idx]; nxt = self.hold_next[l]
+                upto = min(now, end)
+                if upto >= nxt:
+                    k = int((upto - nxt) // step) + 1
+                    ticks += k; self.hold_next[l] = nxt + k*step
+                if now < end:
+                    continue
+                done += 1
+            self.hold_note[l] = None
+            self.sustaining.remove(l)
+        return ticks, done, dropped
+
+    def held(self, n):
+        """True while `n` is a hold being sustained."""
+        return self.hold_note[n.lane] is n
+
+    def expire(self, now):
+        """Mark notes whose window has closed as missed; returns how many."""
+        missed = 0; chords = set()
+        chord = self.chart.chord
+        for lane, q in enumerate(self.active):
+            i = self.judge[lane]
+            while i < len(q) and now - q[i].hit_time > HIT_WIN_T:
+                q[i].missed = True
+                cid = chord[q[i].idx]
+                if cid < 0 or cid not in chords:   # a missed chord counts once
+                    missed += 1; chords.add(cid)
+                i += 1
+            self.judge[lane] = i
+        return missed
+
+    def cull(self):
+        """Drop notes that left the screen (or were eaten).
+        Holds go by their tail, once it has passed."""
+        xs, xe = self.xs, self.xe
+        for lane, q in enumerate(self.active):
+            # both cull conditions imply x < HIT_X-10, so only the head can go
+            k = 0; drop = False
+            for n in q:
+                if xs[n.idx] >= HIT_X-10: break
+                x = xe[n.idx]
+                drop = drop or (x < HIT_X-10 and (x <= -8 or n.hit))
+                k += 1
+            if not drop:
+                continue
+            head = [q.popleft() for _ in range(k)]
+            for n in reversed(head):
+                x = xe[n.idx]
+                if x >= HIT_X-10 or (x>-8 and not n.hit):
+                    q.appendleft(n)
+                else:
+                    # culled notes are always judged, i.e. before the pointer
+                    self.judge[lane] -= 1
+                    self.gone[n.idx] = True
+        lo, gone = self.lo, self.gone
+        while lo < self.next and gone[lo]:
+            lo += 1
+        self.lo = lo
+
+    def seek(self, now, first_hit=-math.inf):
+        """
+        Jump to song time `now` as if the level had been played up to it.
+        Notes that have scrolled in and are not yet past the hit window (nor
+        before `first_hit`) go on screen unjudged; every earlier note counts
+        as gone. A searchsorted and one vectorized compare, so seeking deep
+        into a long chart costs no more than seeking near its start.
+        """
+        self.clear()
+        c = self.chart
+        stop = int(np.searchsorted(c.appear, now, side='right'))
+        keep = c.hit[:stop] >= max(now - HIT_WIN_T, first_hit)
+        self.gone = np.zeros(len(c), bool)
+        self.gone[:stop] = ~keep
+        idx = np.flatnonzero(keep)
+        for i in idx.tolist():
+            self._spawn(i)
+        self.next = stop
+        self.lo = int(idx[0]) if len(idx) else stop
+
+    def reset(self):
+        """Rewind to the unstarted level in place, keeping every array."""
+        self.clear()
+        self.next = self.lo = 0
+        self.gone.fill(False)
+
+    def clear(self):
+        for q in self.active:
+            q.clear()
+        self.next = self.lo = len(self.chart)
+        self.judge = [0]*len(self.active)
+        self.hold_note = [None]*len(self.active)
+        self.sustaining = []
 
 class Duck:
+    __slots__ = ("lanes","idx","y","mouth")
     def __init__(self, laneYs):
         self.lanes=laneYs; self.idx=min(1,len(laneYs)-1)
         self.y=self.lanes[self.idx]; self.mouth=0.0
@@ -289,64 +811,1575 @@ class Duck:
     def draw(self, s): draw_duck(s, HIT_X-6, int(self.y), mouth=(self.mouth>0))
 
 # ================= Scheduling =================
-def lane_ys_for(n):
-    if n == 2:
-        return [60,90]
-    if n == 3:
-        return [50,80,110]
-    # 4 lanes layout (evenly spaced)
-    if n == 4:
-        return [40,65,90,115]
-    return [50,80,110]
+# hand-tuned layouts for the shipped levels; other counts are spread evenly
+LANE_LAYOUTS = {2: [60,90], 3: [50,80,110], 4: [40,65,90,115]}
+LANE_BAND = (34, 122)                 # top/bottom lane centre on the pixel canvas
+MAX_LANES = (LANE_BAND[1]-LANE_BAND[0]) // (LANE_THK+1) + 1
 
-def build_schedule(level):
+def lane_ys_for(n):
+    if n in LANE_LAYOUTS:
+        return list(LANE_LAYOUTS[n])
+    if not 1 <= n <= MAX_LANES:
+        raise ValueError(f"lane count must be 1..{MAX_LANES}, got {n}")
+    if n == 1:
+        return [(LANE_BAND[0]+LANE_BAND[1])//2]
+    return np.rint(np.linspace(LANE_BAND[0], LANE_BAND[1], n)).astype(int).tolist()
+
+TICKS = 8          # 每拍切成 8 份（八分音符精度）；可改为 12/16 提高精度
+MIN_GAP = 1        # 最小间隔：至少错开 1 个 tick；想更宽松可设为 2
+MIN_TIME_GAP = 0.5 # 最小时间间隔（秒）：保证任意两颗音符 spawn 时间相隔至少 0.5s
+# 从屏幕右侧到判定线的飞行时间（用于将“命中时间”换算成“生成时间”）
+TRAVEL_TIME = (PX_W + 12 - HIT_X) / NOTE_SPD
+
+class TempoMap:
+    """
+    Beat -> seconds for a chart with tempo changes, stops and meter changes.
+
+    bpm is the starting tempo (a change at beat 0 replaces it, as in
+    ScrollMap); changes are (beat, bpm) pairs, stops are
+    (beat, seconds) pauses that start once that beat has been reached, and
+    meter is (bar, numerator, denominator) from that bar on. Beats are
+    quarter notes, so the meter only matters for (bar, beat) positions.
+    Cumulative tables are built once; lookups are a bisect / searchsorted.
+    """
+    def __init__(self, bpm, changes=(), stops=(), meter=()):
+        start, segs = float(bpm), []
+        for b, v in sorted((float(b), float(v)) for b, v in changes):
+            if b <= 0: start = v                # a change at beat 0 sets the starting tempo
+            else: segs.append((b, v))
+        segs = [(0.0, start)] + segs
+        if any(v <= 0 for _, v in segs):
+            raise ValueError("tempo must be positive")
+        self.seg_beat = np.array([b for b, _ in segs])
+        self.seg_spb = 60.0 / np.array([v for _, v in segs])       # seconds per beat
+        self.seg_sec = np.concatenate([[0.0], np.cumsum(np.diff(self.seg_beat) * self.seg_spb[:-1])])
+        stops = sorted((float(b), float(d)) for b, d in stops)
+        self.stop_beat = np.array([b for b, _ in stops])
+        self.stop_sum = np.concatenate([[0.0], np.cumsum([d for _, d in stops])])
+        bars = sorted({0: (4, 4), **{int(m): (int(n), int(d)) for m, n, d in meter}}.items())
+        self.bar_no = np.array([m for m, _ in bars])
+        bar_len = np.array([n * 4.0 / d for _, (n, d) in bars])      # quarter-note beats per bar
+        self.bar_len = bar_len
+        self.bar_beat = np.concatenate([[0.0], np.cumsum(np.diff(self.bar_no) * bar_len[:-1])])
+        # plain-float copies for time_at; numpy scalars are slow one at a time
+        self._seg = (self.seg_beat.tolist(), self.seg_spb.tolist(), self.seg_sec.tolist())
+        self._stops = (self.stop_beat.tolist(), self.stop_sum.tolist())
+        stop_at = self.beat_to_sec(self.stop_beat) if stops else np.empty(0)
+        self._stop_at = (stop_at.tolist(), (stop_at + np.diff(self.stop_sum)).tolist())
+
+    @classmethod
+    def for_level(cls, level):
+        return cls(level["bpm"], level.get("tempo", ()), level.get("stops", ()), level.get("meter", ()))
+
+    def beat_to_sec(self, beats):
+        """Vectorized: seconds from beat 0 for an array of beats."""
+        b = np.asarray(beats, dtype=float)
+        i = np.searchsorted(self.seg_beat, b, side='right') - 1
+        i = np.maximum(i, 0)
+        sec = (b - self.seg_beat[i]) * self.seg_spb[i] + self.seg_sec[i]
+        if len(self.stop_beat):
+            sec = sec + self.stop_sum[np.searchsorted(self.stop_beat, b, side='left')]
+        return sec
+
+    def time_at(self, beat):
+        """Scalar beat_to_sec via bisect, for the one-note-at-a-time paths."""
+        seg_beat, seg_spb, seg_sec = self._seg
+        i = max(bisect_right(seg_beat, beat) - 1, 0)
+        sec = (beat - seg_beat[i]) * seg_spb[i] + seg_sec[i]
+        stop_beat, stop_sum = self._stops
+        if stop_beat:
+            sec += stop_sum[bisect_left(stop_beat, beat)]
+        return sec
+
+    def beat_at(self, sec):
+        """Inverse of time_at via bisect; time inside a stop maps to the stop's beat."""
+        stop_at, stop_end = self._stop_at
+        if stop_at:
+            j = bisect_right(stop_end, sec)
+            if j < len(stop_at) and sec >= stop_at[j]:
+                sec = stop_at[j]
+            sec -= self._stops[1][j]
+        seg_beat, seg_spb, seg_sec = self._seg
+        i = max(bisect_right(seg_sec, sec) - 1, 0)
+        return seg_beat[i] + (sec - seg_sec[i]) / seg_spb[i]
+
+    def bar_to_beat(self, bar, beat=0.0):
+        """Quarter-note beat of `beat` beats into bar number `bar` (0-based)."""
+        bar = np.asarray(bar)
+        i = np.maximum(np.searchsorted(self.bar_no, bar, side='right') - 1, 0)
+        return self.bar_beat[i] + (bar - self.bar_no[i]) * self.bar_len[i] + beat
+
+class ScrollMap:
+    """
+    Scroll position (px) of the chart over song time. Sections can scroll
+    faster or slower: level["speed"] = [(beat, multiplier), ...]. The integral
+    of NOTE_SPD * multiplier is tabulated at the section starts, so pos(t) is a
+    lookup plus one linear step and a note hitting at h with its own
+    multiplier m sits at x = HIT_X + m*(pos(h) - pos(now)).
+    """
+    def __init__(self, sections=(), tmap=None):
+        secs = sorted((tmap.time_at(b) if tmap else float(b), float(m)) for b, m in sections)
+        if any(m <= 0 for _, m in secs):
+            raise ValueError("scroll speed multipliers must be positive")
+        base, knots = 1.0, []
+        for t, m in secs:
+            if t <= 0: base = m                 # a section at beat 0 sets the starting speed
+            else: knots.append((t, m))
+        knots = [(0.0, base)] + knots
+        self.t = np.array([t for t, _ in knots])
+        self.v = NOTE_SPD * np.array([m for _, m in knots])
+        self.p = np.concatenate([[0.0], np.cumsum(np.diff(self.t) * self.v[:-1])])
+        self._tab = (self.t.tolist(), self.v.tolist(), self.p.tolist())
+
+    @classmethod
+    def for_level(cls, level, tmap):
+        return cls(level.get("speed", ()), tmap)
+
+    def pos(self, t):
+        """Scalar scroll position at song time t (per frame)."""
+        ts, vs, ps = self._tab
+        i = max(bisect_right(ts, t) - 1, 0)
+        return ps[i] + (t - ts[i]) * vs[i]
+
+    def pos_v(self, t):
+        t = np.asarray(t, dtype=float)
+        i = np.maximum(np.searchsorted(self.t, t, side='right') - 1, 0)
+        return self.p[i] + (t - self.t[i]) * self.v[i]
+
+    def time_at(self, p):
+        """Inverse of pos_v."""
+        p = np.asarray(p, dtype=float)
+        i = np.maximum(np.searchsorted(self.p, p, side='right') - 1, 0)
+        return self.t[i] + (p - self.p[i]) / self.v[i]
+
+class NoteChart:
+    """A level's notes as parallel arrays, sorted by the time they scroll in.
+    Taps have end == hit; holds end later and score a tick every `step` s."""
+    __slots__ = ("appear","hit","phit","mult","lane","end","pend","step","chord","has_holds","scroll")
+    def __len__(self):
+        return len(self.hit)
+    @classmethod
+    def empty(cls):
+        return compile_chart([], ScrollMap())
+
+def compile_chart(schedule, scroll):
+    """
+    Precompute what the per-frame passes need from build_schedule output:
+    hit time, scroll position at the hit, speed multiplier, and the time the
+    note crosses the spawn edge (x = PX_W+12), i.e. when to spawn it.
+    """
+    hit = np.array([info["hit"] for info in schedule], dtype=float)
+    mult = np.array([info.get("speed", 1.0) for info in schedule], dtype=float)
+    lane = np.array([info["lane"] for info in schedule], dtype=np.int64)
+    end = np.array([info.get("end", info["hit"]) for info in schedule], dtype=float)
+    step = np.array([info.get("step", 0.0) for info in schedule], dtype=float)
+    chord = np.array([info.get("chord", -1) for info in schedule], dtype=np.int64)
+    return compile_arrays(hit, mult, lane, end, step, chord, scroll)
+
+def compile_arrays(hit, mult, lane, end, step, chord, scroll):
+    """compile_chart for a schedule already held as parallel arrays."""
+    c = NoteChart()
+    phit = scroll.pos_v(hit)
+    appear = np.maximum(0.0, scroll.time_at(phit - (PX_W+12 - HIT_X) / np.maximum(mult, 1e-9)))
+    order = np.argsort(appear, kind='stable')
+    c.appear, c.hit, c.phit, c.mult, c.lane = appear[order], hit[order], phit[order], mult[order], lane[order]
+    c.end, c.step, c.chord = end[order], step[order], chord[order]
+    c.pend = scroll.pos_v(c.end)
+    c.has_holds = bool((c.end > c.hit).any())
+    c.scroll = scroll
+    return c
+
+def chart_for_level(level):
+    tmap = TempoMap.for_level(level)
+    return compile_chart(build_schedule(level, tmap), ScrollMap.for_level(level, tmap))
+
+def pattern_beats(level, tmap):
+    """Pattern positions as beats; (bar, beat) pairs go through the meter."""
+    out = np.empty(len(level["pattern"]))
+    for k, entry in enumerate(level["pattern"]):
+        pos = entry[0]
+        out[k] = tmap.bar_to_beat(*pos) if isinstance(pos, tuple) else pos
+    return out
+
+def build_schedule(level, tmap=None):
     """
     把节拍量化到 tick（避免浮点比较误差），并强制同一时间只生成一颗音符。
     如果同一拍（或过近）出现多个音符，就把后面的顺延 1 个 tick。
+    节拍→秒 通过 TempoMap（支持变速 / 停顿 / 拍号），整张谱面一次向量化换算；
+    只有需要顺延的音符才逐个处理。
+    level["chords"] = True 时，同一 tick 不同轨的音符组成和弦，一起顺延。
     """
-    TICKS = 8          # 每拍切成 8 份（八分音符精度）；可改为 12/16 提高精度
-    MIN_GAP = 1        # 最小间隔：至少错开 1 个 tick；想更宽松可设为 2
-    MIN_TIME_GAP = 0.5 # 最小时间间隔（秒）：保证任意两颗音符 spawn 时间相隔至少 0.5s
+    tmap = tmap or TempoMap.for_level(level)
+    if not level["pattern"]:
+        return []
+
+    # 先按 beat 排序（稳定排序，与逐个处理的顺序一致）
+    beats = pattern_beats(level, tmap)
+    order = np.argsort(beats, kind='stable')
+    lanes = np.array([entry[1] for entry in level["pattern"]])[order]
+    ticks = np.rint(beats[order] * TICKS).astype(np.int64)
+    lead = np.ones(len(ticks), bool)       # first note of each chord (every note without chords)
+    if level.get("chords"):
+        by_lane = np.lexsort((lanes, ticks))
+        order, lanes, ticks = order[by_lane], lanes[by_lane], ticks[by_lane]
+        # same tick joins the chord; the same tick on the same lane starts a new one
+        lead[1:] = (ticks[1:] != ticks[:-1]) | (lanes[1:] == lanes[:-1])
+    group = np.cumsum(lead) - 1
+    # optional third element: per-note options, e.g. {"speed": 1.5, "hold": 2}
+    opts = [level["pattern"][k][2] if len(level["pattern"][k]) > 2 else {} for k in order]
+
+    gticks, gspawn = _space_ticks(ticks[lead], tmap)
+    beat = np.asarray(gticks)[group] / TICKS
+    spawn = np.asarray(gspawn)[group].tolist()
+    chord = np.bincount(group) > 1
+    cid = np.where(chord[group], group, -1).tolist()
+
+    # 整张谱面一次换算成秒：击打时间、长按结束、长按计分间隔
+    # sustain: ends `hold` beats later, scores a tick every quarter beat
+    hold = np.array([o.get("hold") or 0 for o in opts], float)
+    hit = tmap.beat_to_sec(beat)
+    end = tmap.beat_to_sec(beat + hold).tolist()
+    step = (tmap.beat_to_sec(beat + 0.25) - hit).tolist()
+    hit = hit.tolist()
 
-    bpm = level["bpm"]
+    # 已按顺序生成；返回给主循环使用
+    out = []
+    for n, (lane, o) in enumerate(zip(lanes.tolist(), opts)):
+        info = {"spawn": spawn[n], "lane": lane, "hit": hit[n], "speed": o.get("speed", 1.0),
+                "chord": cid[n]}
+        if o.get("hold"):
+            info["end"] = end[n]
+            info["step"] = step[n]
+        out.append(info)
+    return out
+
+def _space_ticks(ticks, tmap):
+    """
+    Shift sorted ticks so they are MIN_GAP apart and their spawns MIN_TIME_GAP
+    apart; returns (ticks, spawn times) as lists.
+    """
+    travel_time = TRAVEL_TIME
+    hit = tmap.beat_to_sec(ticks / TICKS)
+    spawn = np.maximum(0.0, hit - travel_time)
+
+    # 第一颗违反规则（同 tick / 太近 / spawn 间隔不足）的音符；之前的全部原样保留
+    bad = np.flatnonzero((np.diff(ticks) < MIN_GAP) | (np.diff(spawn) < MIN_TIME_GAP))
+    k = int(bad[0]) + 1 if len(bad) else len(ticks)
+    ticks = ticks.tolist(); spawn = spawn.tolist()
+
+    last_tick = ticks[k-1] if k else -10**9
+    last_spawn = spawn[k-1] if k else -1e9
+    spawn_of = lambda tk: max(0.0, tmap.time_at(tk / TICKS) - travel_time)
+    for n in range(k, len(ticks)):
+        tick, sp = _place_tick(ticks[n], spawn[n], last_tick, last_spawn, tmap, spawn_of)
+        ticks[n] = tick; spawn[n] = sp
+        last_tick = tick; last_spawn = sp
+    return ticks, spawn
+
+def _place_tick(tick, sp, last_tick, last_spawn, tmap, spawn_of):
+    """One step of the spacing pass: where a note at `tick` (spawning at
+    `sp`) lands after a note placed at last_tick / last_spawn."""
+    # ticks 单调递增，所以“已占用”等价于 <= last_tick：直接跳到第一个可用 tick
+    raw = tick
+    tick = max(raw, last_tick + MIN_GAP)
+    if tick != raw:
+        sp = spawn_of(tick)
+    if sp - last_spawn < MIN_TIME_GAP:
+        # 保证与上一个 spawn 至少间隔 MIN_TIME_GAP：由反查估计，再逐 tick 校正
+        lo = tick
+        tick = max(lo, math.ceil(tmap.beat_at(last_spawn + MIN_TIME_GAP + TRAVEL_TIME) * TICKS))
+        while tick > lo and spawn_of(tick - 1) - last_spawn >= MIN_TIME_GAP:
+            tick -= 1
+        sp = spawn_of(tick)
+        while sp - last_spawn < MIN_TIME_GAP:
+            tick += 1; sp = spawn_of(tick)
+    return tick, sp
+
+EDIT_SNAP = 0.5    # beats: the chart editor places notes on half beats
+EDIT_AHEAD = 72    # px: its cursor sits this far right of the duck
+
+class LiveSchedule:
+    """
+    build_schedule for a level that is being edited. Notes are kept in the
+    order build_schedule processes them, each with its spaced tick and spawn
+    time, and the compiled per-note fields as arrays. The spacing pass
+    carries nothing from one note to the next but the last tick and spawn,
+    so after an add or remove it is re-run from the edited note only until
+    a note lands where it was before; everything after that is unchanged.
+    Edits also go into level["pattern"].
+    """
+    def __init__(self, level):
+        self.level = level
+        self.tmap = TempoMap.for_level(level)
+        self.scroll = ScrollMap.for_level(level, self.tmap)
+        self.chords = bool(level.get("chords"))
+        self.spawn_of = lambda tk: max(0.0, self.tmap.time_at(tk / TICKS) - TRAVEL_TIME)
+        pattern = level["pattern"]
+        beats = pattern_beats(level, self.tmap)
+        ticks = np.rint(beats * TICKS).astype(np.int64).tolist()
+        notes = sorted(self._key(ticks[k], entry[1], float(beats[k]), k) + (entry,)
+                       for k, entry in enumerate(pattern))
+        self.seq = len(pattern)
+        self.keys = [n[:-1] for n in notes]     # sort key; ends with an insertion counter
+        self.entry = [n[-1] for n in notes]     # the pattern entry of each note
+        self.raw = [k[0] for k in self.keys]
+        self.tick = [0]*len(notes); self.spawn = [0.0]*len(notes)
+        n = len(notes)
+        self.hit, self.end, self.step, self.mult = np.zeros(n), np.zeros(n), np.zeros(n), np.ones(n)
+        self.lane = np.array([e[1] for e in self.entry], dtype=np.int64)
+        self.chord = np.full(n, -1, dtype=np.int64)
+        self._chart = None
+        self._respace(0, n)
+
+    def _key(self, tick, lane, beat, seq):
+        # build_schedule's order: by beat, pattern order on ties; chords by tick and lane first
+        return (tick, lane, beat, seq) if self.chords else (tick, beat, seq)
+
+    def __len__(self):
+        return len(self.raw)
+
+    def _lead(self, i):
+        """First note of its chord (every note without chords)."""
+        return (not self.chords or i == 0 or self.raw[i] != self.raw[i-1]
+                or self.lane[i] == self.lane[i-1])
+
+    def add(self, beat, lane, opts=None):
+        entry = (beat, lane, opts) if opts else (beat, lane)
+        tick = int(np.rint(beat * TICKS))
+        key = self._key(tick, lane, float(beat), self.seq); self.seq += 1
+        i = bisect_left(self.keys, key)
+        self.level["pattern"].append(entry)
+        self.keys.insert(i, key); self.entry.insert(i, entry); self.raw.insert(i, tick)
+        self.tick.insert(i, None); self.spawn.insert(i, None)
+        self.hit, self.end, self.step = (np.insert(a, i, 0.0) for a in (self.hit, self.end, self.step))
+        self.mult = np.insert(self.mult, i, 1.0)
+        self.lane = np.insert(self.lane, i, lane)
+        self.chord = np.insert(self.chord, i, -1)
+        self._respace(i, i+1)
+        return i
+
+    def note_at(self, beat, lane):
+        """Index of the note in `lane` that lands within half a snap step of
+        `beat` after spacing (i.e. the one drawn there), or None."""
+        half = EDIT_SNAP * TICKS / 2
+        at = beat * TICKS
+        lo, hi = bisect_left(self.tick, at - half), bisect_right(self.tick, at + half)
+        near = [i for i in range(lo, hi) if self.lane[i] == lane]
+        return min(near, key=lambda i: abs(self.tick[i] - at)) if near else None
+
+    def remove(self, i):
+        """Remove note i (an index from add() or note_at())."""
+        pattern = self.level["pattern"]
+        del pattern[next(k for k, e in enumerate(pattern) if e is self.entry[i])]
+        for a in (self.keys, self.entry, self.raw, self.tick, self.spawn):
+            del a[i]
+        self.hit, self.end, self.step, self.mult, self.lane, self.chord = (
+            np.delete(a, i) for a in (self.hit, self.end, self.step, self.mult, self.lane, self.chord))
+        self._respace(i, i)
+
+    def toggle(self, beat, lane):
+        """Remove the note drawn at `beat` in `lane`, or add one there; True if added."""
+        i = self.note_at(beat, lane)
+        if i is not None:
+            self.remove(i)
+            return False
+        self.add(beat, lane)
+        return True
+
+    def _respace(self, i, edited):
+        """Re-run spacing from note i; notes from `edited` on are unchanged
+        input, so the pass stops at the first of them that lands as before."""
+        n = len(self.raw)
+        tick, spawn, raw = self.tick, self.spawn, self.raw
+        last_tick = tick[i-1] if i else -10**9
+        last_spawn = spawn[i-1] if i else -1e9
+        start = i
+        while i < n:
+            if self._lead(i):
+                tk, sp = _place_tick(raw[i], self.spawn_of(raw[i]), last_tick, last_spawn, self.tmap, self.spawn_of)
+                if i >= edited and tk == tick[i] and sp == spawn[i]:
+                    break
+                last_tick, last_spawn = tk, sp
+            tick[i], spawn[i] = last_tick, last_spawn
+            i += 1
+        self._fill(start, i)
+        self._chart = None
+
+    def _fill(self, a, b):
+        """Per-note fields for notes a..b, and chord ids around them."""
+        time_at = self.tmap.time_at
+        for i in range(a, b):
+            entry = self.entry[i]
+            o = entry[2] if len(entry) > 2 else {}
+            beat = self.tick[i] / TICKS; hit = time_at(beat)
+            self.hit[i] = hit; self.mult[i] = o.get("speed", 1.0)
+            if o.get("hold"):
+                self.end[i] = time_at(beat + o["hold"])
+                self.step[i] = time_at(beat + 0.25) - hit
+            else:
+                self.end[i] = hit; self.step[i] = 0.0
+        if not self.chords:
+            return
+        # an edit can grow or shrink the chords next to it too
+        n = len(self.raw)
+        a = max(a-1, 0); b = min(max(b, a+2), n)
+        while a > 0 and not self._lead(a): a -= 1
+        while b < n and not self._lead(b): b += 1
+        g = a
+        for i in range(a+1, b+1):
+            if i == b or self._lead(i):
+                # ids only need to be unique, and a chord's tick is
+                self.chord[g:i] = self.tick[g] if i - g > 1 else -1
+                g = i
+
+    def chart(self):
+        """The compiled NoteChart; rebuilt (vectorized) only after an edit."""
+        if self._chart is None:
+            self._chart = compile_arrays(self.hit, self.mult, self.lane, self.end, self.step,
+                                         self.chord, self.scroll)
+        return self._chart
+
+    def loop_time(self):
+        """Song time at which the editor's preview starts over: a second
+        after the last note ends, and no sooner than beat 8."""
+        last = float(self.end.max()) if len(self.end) else 0.0
+        return max(last, self.tmap.time_at(8)) + 1.0
+
+    def cursor(self, now):
+        """(beat, x) of the snapped beat EDIT_AHEAD px right of the duck."""
+        sc = self.scroll
+        p = sc.pos(now)
+        beat = self.tmap.beat_at(float(sc.time_at(p + EDIT_AHEAD)))
+        beat = max(0.0, round(beat / EDIT_SNAP) * EDIT_SNAP)
+        return beat, HIT_X + sc.pos(self.tmap.time_at(beat)) - p
+
+# ================= Chart analysis =================
+WINDOW = 2.0       # seconds per sliding window when looking for the hardest section
+
+def _chart_events(chart):
+    """(hit, end, lane) of a build_schedule list or NoteChart, by hit time,
+    with each chord reduced to one event (eating any note eats all of it)."""
+    if isinstance(chart, NoteChart):
+        hit, end, lane, chord = chart.hit, chart.end, chart.lane, chart.chord
+    else:
+        hit = np.array([info["hit"] for info in chart], dtype=float)
+        end = np.array([info.get("end", info["hit"]) for info in chart], dtype=float)
+        lane = np.array([info["lane"] for info in chart], dtype=np.int64)
+        chord = np.array([info.get("chord", -1) for info in chart], dtype=np.int64)
+    order = np.argsort(hit, kind='stable')
+    hit, end, lane, chord = hit[order], end[order], lane[order], chord[order]
+    keep = chord < 0
+    keep[1:] |= chord[1:] != chord[:-1]
+    keep[:1] = True
+    return hit[keep], end[keep], lane[keep]
+
+def analyze_charts(charts, window=WINDOW):
+    """
+    Difficulty figures for many charts at once (build_schedule lists or
+    NoteCharts). All charts are laid end to end on one time axis, far enough
+    apart that no window spans two of them, so every measure below is a
+    handful of array passes over all notes together. Per chart, a dict of:
+      notes            events (a chord counts once)
+      length           seconds from first to last hit
+      density          notes/s over the chart (at least one window long)
+      switch_rate      lane changes/s over the same span
+      min_reaction     shortest gap (s) from a note, or the end of a hold, to
+                       the next note in another lane; None without lane changes
+      peak_density,    notes/s and lane changes/s in the hardest `window`
+      peak_switch_rate   seconds, judged by their sum
+      peak             (start, end) hit times of that section
+      difficulty       peak_density + peak_switch_rate, to sort levels by
+    """
+    events = [_chart_events(c) for c in charts]
+    stats = [dict(notes=0, length=0.0, density=0.0, switch_rate=0.0, min_reaction=None,
+                  peak_density=0.0, peak_switch_rate=0.0, peak=(0.0, 0.0), difficulty=0.0)
+             for _ in charts]
+    used = [k for k, ev in enumerate(events) if len(ev[0])]
+    if not used:
+        return stats
+    counts = np.array([len(events[k][0]) for k in used])
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    cid = np.repeat(np.arange(len(used)), counts)
+    hit = np.concatenate([events[k][0] for k in used])
+    end = np.concatenate([events[k][1] for k in used])
+    lane = np.concatenate([events[k][2] for k in used])
+    first = hit[starts]
+    length = hit[starts + counts - 1] - first
+    # chart k starts at k * gap on the shared axis
+    gap = float(length.max()) + window + 1.0
+    t = hit - first[cid] + cid * gap
+
+    new_chart = np.zeros(len(t), bool); new_chart[starts] = True
+    switch = np.zeros(len(t), bool)
+    switch[1:] = lane[1:] != lane[:-1]
+    switch &= ~new_chart
+    reaction = np.full(len(t), np.inf)
+    # from the previous hold's end, or from its head when the next note cuts it short
+    prev = np.where(end[:-1] <= hit[1:], end[:-1], hit[:-1])
+    reaction[1:] = hit[1:] - prev
+    reaction[~switch] = np.inf
+    min_reaction = np.minimum.reduceat(reaction, starts)
+
+    span = np.maximum(length, window)
+    n_switch = np.add.reduceat(switch, starts)
+    # window [t_i, t_i + window) for every note i; switches counted between its notes
+    stop = np.searchsorted(t, t + window, side='left')
+    csw = np.cumsum(switch)
+    in_count = stop - np.arange(len(t))
+    in_switch = csw[stop - 1] - csw
+    score = (in_count + in_switch) / window
+    best = np.lexsort((-score, cid))[starts]     # first window with the highest score per chart
+
+    for j, k in enumerate(used):
+        b = best[j]
+        st = stats[k]
+        st["notes"] = int(counts[j])
+        st["length"] = float(length[j])
+        st["density"] = float(counts[j] / span[j])
+        st["switch_rate"] = float(n_switch[j] / span[j])
+        st["min_reaction"] = None if np.isinf(min_reaction[j]) else float(min_reaction[j])
+        st["peak_density"] = float(in_count[b] / window)
+        st["peak_switch_rate"] = float(in_switch[b] / window)
+        st["peak"] = (float(hit[b]), float(hit[stop[b] - 1]))
+        st["difficulty"] = float(score[b])
+    return stats
+
+def analyze_chart(chart, window=WINDOW):
+    return analyze_charts([chart], window)[0]
+
+def print_level_analysis(levels):
+    """--analyze: one line per level, easiest first (peak section, then overall rate)."""
+    stats = analyze_charts([chart_for_level(lv) for lv in levels])
+    rows = sorted(zip(levels, stats), key=lambda r: (r[1]["difficulty"], r[1]["density"] + r[1]["switch_rate"]))
+    print(f"{'level':<12}{'notes':>6}{'len s':>7}{'n/s':>6}{'sw/s':>6}{'react s':>8}{'peak n/s':>9}{'peak sw/s':>10}  peak section")
+    for lv, st in rows:
+        react = "-" if st["min_reaction"] is None else f"{st['min_reaction']:.2f}"
+        print(f"{lv['name']:<12}{st['notes']:>6}{st['length']:>7.1f}{st['density']:>6.2f}{st['switch_rate']:>6.2f}"
+              f"{react:>8}{st['peak_density']:>9.2f}{st['peak_switch_rate']:>10.2f}  {st['peak'][0]:.1f}-{st['peak'][1]:.1f} s")
+
+# ================= Per-frame passes =================
+def hit_pass(field, duck, now, auto=False):
+    """Judge the notes inside the hit window at song time `now`; returns the hits.
+
+    With auto=True (record / demo mode) every lane is checked and the duck
+    snaps to each note's lane, otherwise only the duck's current lane counts.
+    """
+    hits = []
+    for lane in (range(len(field.active)) if auto else (duck.idx,)):
+        n = field.hit(lane, now)
+        if n is None:
+            continue
+        if auto:
+            duck.idx = n.lane
+            duck.y = duck.lanes[duck.idx]
+        duck.eat()
+        hits.append(n)
+    return hits
+
+def hold_pass(field, duck, now):
+    """Sustain hold notes in the duck's lane; returns the hold ticks scored."""
+    ticks, _, _ = field.sustain(duck.idx, now)
+    if field.sustaining:
+        duck.eat()
+    return ticks
+
+def miss_pass(field, now):
+    """Count notes whose hit window closed by `now` (each note counts once)."""
+    return field.expire(now)
+
+# ================= Chart generation =================
+def read_wav(path):
+    """Memory-map the PCM data of a WAV file without decoding it.
+
+    Returns (samples, sr, scale): samples is a read-only np.memmap of shape
+    (frames, channels); multiply by scale (after subtracting 128 for 8-bit)
+    to get floats in [-1, 1]. Supports 8/16/32-bit PCM and 32-bit float.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if len(head) < 12 or head[:4] != b'RIFF' or head[8:12] != b'WAVE':
+            raise ValueError(f"{path}: not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            ch = f.read(8)
+            if len(ch) < 8:
+                raise ValueError(f"{path}: no data chunk")
+            cid, size = ch[:4], int.from_bytes(ch[4:], 'little')
+            if cid == b'fmt ':
+                body = f.read(size)
+                tag, chans, sr = int.from_bytes(body[0:2], 'little'), int.from_bytes(body[2:4], 'little'), int.from_bytes(body[4:8], 'little')
+                bits = int.from_bytes(body[14:16], 'little')
+                if tag == 0xFFFE and size >= 26:     # WAVE_FORMAT_EXTENSIBLE: real tag in the sub-format GUID
+                    tag = int.from_bytes(body[24:26], 'little')
+                fmt = (tag, chans, sr, bits)
+            elif cid == b'data':
+                if fmt is None:
+                    raise ValueError(f"{path}: data chunk before fmt chunk")
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + (size & 1), 1)     # chunks are word aligned
+    tag, chans, sr, bits = fmt
+    kinds = {(1, 8): ('u1', 1/128), (1, 16): ('<i2', 1/32768), (1, 32): ('<i4', 1/2**31), (3, 32): ('<f4', 1.0)}
+    if (tag, bits) not in kinds:
+        raise ValueError(f"{path}: unsupported WAV format (tag {tag}, {bits}-bit)")
+    dtype, scale = kinds[(tag, bits)]
+    frames = size // (chans * bits//8)
+    samples = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, chans))
+    return samples, sr, scale
+
+def _mono_block(samples, scale, start, stop):
+    x = np.asarray(samples[start:stop], dtype=np.float32)
+    if samples.dtype == np.uint8:
+        x -= 128
+    mix = np.full(x.shape[1], scale / x.shape[1], np.float32)
+    return x @ mix
+
+def onset_envelope(samples, sr, scale, n_fft=1024, hop=512, block=2048):
+    """Spectral flux (positive log-magnitude differences) per hop, plus the
+    spectral centroid of each frame. The STFT runs `block` frames at a time,
+    reading only that slice of the memory-mapped audio."""
+    total = (len(samples) - n_fft) // hop + 1
+    if total < 2:
+        raise ValueError("audio too short for onset detection")
+    window = np.hanning(n_fft).astype(np.float32)
+    freqs = np.fft.rfftfreq(n_fft, 1.0/sr).astype(np.float32)
+    flux = np.empty(total, np.float32); centroid = np.empty(total, np.float32)
+    prev = None
+    for f0 in range(0, total, block):
+        nfr = min(block, total - f0)
+        x = _mono_block(samples, scale, f0*hop, (f0+nfr-1)*hop + n_fft)
+        frames = np.lib.stride_tricks.sliding_window_view(x, n_fft)[::hop] * window
+        mag = np.abs(np.fft.rfft(frames, axis=1))
+        centroid[f0:f0+nfr] = (mag @ freqs) / np.maximum(mag.sum(axis=1), 1e-9)
+        logmag = np.log1p(100.0 * mag)
+        if prev is None:
+            prev = logmag[:1]
+        diff = np.diff(np.concatenate([prev, logmag]), axis=0)
+        flux[f0:f0+nfr] = np.maximum(diff, 0).sum(axis=1)
+        prev = logmag[-1:]
+    return flux, centroid
+
+def pick_peaks(env, w=3, avg=16, delta=3.0, min_dist=4):
+    """Indices of local maxima of env that rise `delta` standard deviations
+    above its moving average."""
+    e = (env - env.mean()) / max(float(env.std()), 1e-9)
+    pad = np.pad(e, (w, w), mode='edge')
+    local_max = e >= np.lib.stride_tricks.sliding_window_view(pad, 2*w+1).max(axis=1)
+    c = np.cumsum(np.pad(e, (avg+1, avg), mode='edge'))
+    mean = (c[2*avg+1:] - c[:-(2*avg+1)]) / (2*avg+1)
+    idx = np.flatnonzero(local_max & (e >= mean + delta))
+    if len(idx) > 1 and min_dist > 1:
+        # drop peaks closer than min_dist frames to the previous kept one
+        keep = [idx[0]]
+        for i in idx[1:]:
+            if i - keep[-1] >= min_dist: keep.append(i)
+        idx = np.asarray(keep)
+    return idx
+
+def estimate_tempo(env, frame_rate, lo=70, hi=180, prior=120):
+    """(bpm, phase in frames) from the onset envelope's autocorrelation,
+    weighted towards `prior` to avoid picking half/double tempo."""
+    e = env - env.mean()
+    n = 1 << int(np.ceil(np.log2(2*len(e))))
+    spec = np.fft.rfft(e, n)
+    ac = np.fft.irfft(spec * np.conj(spec), n)[:len(e)]
+    lags = np.arange(max(1, int(frame_rate*60/hi)), int(frame_rate*60/lo) + 1)
+    lags = lags[lags < len(ac)-1]
+    bpms = 60.0 * frame_rate / lags
+    score = ac[lags] * np.exp(-0.5 * (np.log2(bpms/prior) / 0.9)**2)
+    lag = float(lags[int(np.argmax(score))])
+    # refine on a fine grid around the integer lag: the comb (first Fourier
+    # coefficient at 1/lag) with the largest magnitude wins, and its angle is
+    # the beat phase, so the fractional period doesn't drift over a long song
+    n_idx = np.arange(len(env))
+    for span in (0.03, 0.0015):
+        fine = lag * np.linspace(1 - span, 1 + span, 49)
+        z = np.exp(np.outer(-2j*np.pi/fine, n_idx)) @ env
+        k = int(np.argmax(np.abs(z))); lag = float(fine[k])
+    phase = (-np.angle(z[k]) / (2*np.pi) % 1.0) * lag
+    return 60.0 * frame_rate / lag, phase
+
+def fit_beat_grid(times, bpm, t0):
+    """Least-squares refine (bpm, t0) against onset times that fall near the
+    estimated grid, correcting slow drift from the lag resolution."""
+    beat = 60.0 / bpm
+    for _ in range(2):
+        k = np.rint((times - t0) / beat)
+        near = np.abs(times - t0 - k*beat) < 0.15*beat
+        if near.sum() < 8:
+            break
+        beat, t0 = np.polyfit(k[near], times[near], 1)
+    return 60.0 / beat, t0
+
+def chart_from_wav(path, lanes=3, name=None, n_fft=1024, hop=512):
+    """
+    Build a level dict from a WAV file: onsets become notes, quantized to
+    build_schedule's tick grid at the estimated tempo and thinned so spawns
+    keep MIN_TIME_GAP (so build_schedule never has to shift them). Lanes are
+    assigned by spectral-centroid band, higher pitch on the upper lanes.
+    level["song"] records the file and the audio time of beat 0 (negative when
+    the chart leads in before the music starts).
+    """
+    samples, sr, scale = read_wav(path)
+    flux, centroid = onset_envelope(samples, sr, scale, n_fft, hop)
+    frame_rate = sr / hop
+    peaks = pick_peaks(flux)
+    frame_t = lambda fr: fr * hop / sr + n_fft / (2*sr)    # centre of the analysis window
+    times = frame_t(peaks)
+    bpm, phase = estimate_tempo(flux, frame_rate)
+    bpm, t_first = fit_beat_grid(times, bpm, frame_t(phase))
     beat_sec = 60.0 / bpm
+    # enough lead-in beats that the first note can scroll in from the edge
+    lead = int(np.ceil(TRAVEL_TIME / beat_sec))
+    beat0 = t_first - (np.floor(t_first / beat_sec) + lead) * beat_sec
+    ticks = np.rint((times - beat0) / beat_sec * TICKS).astype(np.int64)
+    ok = ticks >= lead*TICKS
+    ticks, cents, strength = ticks[ok], centroid[peaks][ok], flux[peaks][ok]
+    # thin to the spawn-gap rule (stronger onset wins on a shared tick)
+    hit = ticks / TICKS * beat_sec
+    spawn = np.maximum(0.0, hit - TRAVEL_TIME)
+    order = np.lexsort((-strength, ticks))
+    keep = []; last_spawn = -1e9; last_tick = None
+    for i in order:
+        if ticks[i] == last_tick or spawn[i] - last_spawn < MIN_TIME_GAP:
+            continue
+        keep.append(i); last_spawn = spawn[i]; last_tick = ticks[i]
+    keep = np.asarray(keep, dtype=np.int64)
+    if lanes > 1 and len(keep):
+        edges = np.quantile(cents[keep], np.linspace(0, 1, lanes+1)[1:-1])
+        lane_of = (lanes-1) - np.searchsorted(edges, cents[keep], side='right')
+    else:
+        lane_of = np.zeros(len(keep), np.int64)
+    pattern = [(int(tk)/TICKS, int(ln)) for tk, ln in zip(ticks[keep], lane_of)]
+    return dict(name=name or os.path.splitext(os.path.basename(path))[0], bpm=round(float(bpm), 2), lanes=lanes,
+                pattern=pattern, song=dict(path=os.path.abspath(path), offset=round(float(beat0), 4)))
 
-    # 计算从屏幕右侧到判定线的飞行时间（用于将“命中时间”换算成“生成时间”）
-    start_x = PX_W + 12
-    travel_time = (start_x - HIT_X) / NOTE_SPD
+# ================= Song streaming =================
+class PcmStream:
+    """
+    Background track fed to a Channel in short chunks, converted to the
+    mixer format as the previous chunk plays: only two chunks are in flight,
+    and starting anywhere in the track costs one chunk. `samples` is a
+    (frames, channels) integer or float array at rate `sr` (scale maps it
+    to [-1, 1]); `offset` is the track time of beat 0, negative offsets
+    play silence first. With loop=True the track repeats, as the
+    synthesized songs do. `rate` plays it slower or faster (and lower or
+    higher, like tape) by linear interpolation over the source samples.
+    The chunks of the last start are kept, so starting at the same place
+    again (a retry, an A-B loop) converts nothing.
+    """
+    __slots__ = ("samples","sr","scale","bias","offset","chunk_sec","loop","rate","channel","pos","step","intro")
+    def __init__(self, samples, sr, scale, offset=0.0, chunk_sec=0.25, loop=False):
+        self.samples, self.sr, self.scale = samples, sr, scale
+        # unsigned PCM is centred on mid-scale
+        self.bias = 1 << (8*samples.dtype.itemsize - 1) if samples.dtype.kind == 'u' else 0
+        self.offset = offset; self.chunk_sec = chunk_sec; self.loop = loop
+        self.rate = 1.0
+        self.channel = None; self.pos = 0.0; self.step = 1.0
+        self.intro = None       # ((at, step), first chunk, second chunk, pos after them)
+
+    @classmethod
+    def from_sound(cls, snd, loop=True):
+        """Stream a Sound's own samples (e.g. a cached synthesized song); no copy is made."""
+        freq, bits, _ = pygame.mixer.get_init()
+        return cls(sound_pcm(snd), freq, 1.0 / (1 << (abs(bits) - 1)), loop=loop)
+
+    def play(self, channel, at=0.0):
+        """Start on `channel` at game time `at` seconds after beat 0."""
+        freq = pygame.mixer.get_init()[0]
+        self.step = self.sr / freq * self.rate      # source frames per output frame
+        self.channel = channel
+        key = (at, self.step)
+        if self.intro is not None and self.intro[0] == key:
+            _, first, second, self.pos = self.intro
+        else:
+            self.pos = (self.offset + at) * self.sr
+            first = self._next_chunk()
+            second = self._next_chunk() if first is not None else None
+            self.intro = (key, first, second, self.pos)
+        if first is None:
+            self.stop(); return
+        channel.play(first)
+        if second is not None: channel.queue(second)
+
+    def pump(self):
+        """Keep one chunk queued behind the playing one; call once a frame."""
+        ch = self.channel
+        if ch is None: return
+        if not ch.get_busy():               # underrun (long hitch): restart from where we are
+            snd = self._next_chunk()
+            if snd is None: self.channel = None
+            else: ch.play(snd)
+            return
+        if ch.get_queue() is None:
+            snd = self._next_chunk()
+            if snd is not None: ch.queue(snd)
+
+    def stop(self):
+        if self.channel is not None: self.channel.stop()
+        self.channel = None
+
+    def _next_chunk(self):
+        freq, _, nch = pygame.mixer.get_init()
+        n_out = int(self.chunk_sec * freq)
+        L = len(self.samples)
+        start = self.pos
+        if start >= L and not self.loop: return None
+        self.pos = start + n_out * self.step
+        if self.loop: self.pos %= L
+        # linear interpolation between the two source frames around each output frame
+        idx = start + np.arange(n_out) * self.step
+        i0 = np.floor(idx).astype(np.int64)
+        fr = (idx - i0).astype(np.float32)[:, None]
+        x0, x1 = self._frames(i0), self._frames(i0 + 1)
+        x1 -= x0; x1 *= fr; x0 += x1
+        x0 *= self.scale
+        x = x0
+        if x.shape[1] != nch:               # mono <-> stereo
+            x = x.mean(axis=1)
+        snd = blank_sound(len(x))
+        write_pcm(sound_pcm(snd), x)
+        return snd
+
+    def _frames(self, i):
+        """Source frames at indices i as float32; silence outside the track unless looping."""
+        L = len(self.samples)
+        if self.loop: i = i % L
+        x = self.samples[np.clip(i, 0, L-1)].astype(np.float32)
+        if self.bias: x -= self.bias
+        if not self.loop:
+            x[(i < 0) | (i >= L)] = 0
+        return x
+
+class WavStream(PcmStream):
+    """A song played straight from a memory-mapped WAV (see read_wav); a
+    multi-minute song starts at once and is never decoded as a whole."""
+    __slots__ = ("path",)
+    def __init__(self, path, offset=0.0, chunk_sec=0.25):
+        self.path = path
+        samples, sr, scale = read_wav(path)
+        super().__init__(samples, sr, scale, offset, chunk_sec)
+
+def bg_track_for(level, bg_for):
+    """Streamed song for levels that name one, else the synthesized melody."""
+    song = level.get("song")
+    if song:
+        return WavStream(song["path"], song.get("offset", 0.0))
+    return bg_for(level["bpm"])
+
+# ================= Level prefetch =================
+class LevelBundle:
+    """Everything start_level needs, built ahead of time: layout, compiled
+    note chart, lane tones and the background song."""
+    __slots__ = ("index","level","laneYs","chart","tones","bg")
+
+def build_level_bundle(i, tones_for, bg_for):
+    b = LevelBundle()
+    b.index = i; b.level = LEVELS[i]
+    b.laneYs = lane_ys_for(b.level["lanes"])
+    b.chart = chart_for_level(b.level)
+    b.tones = tones_for(b.level["lanes"])
+    b.bg = bg_track_for(b.level, bg_for)
+    return b
+
+class LevelPrefetcher:
+    """
+    Builds LevelBundles on a worker thread as soon as a level is likely to be
+    played next (pass screen -> next level, select screen -> hovered level),
+    so starting it is a swap instead of scheduling + synthesis. Bundles are
+    read-only once built and stay cached, which also makes retries instant.
+    """
+    def __init__(self, build):
+        self.build = build
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level-prefetch")
+        self.futures = {}
 
-    used_ticks = set()
-    last_tick  = -10**9
-    last_spawn = -1e9
-    schedule   = []
+    def want(self, i):
+        if 0 <= i < len(LEVELS) and i not in self.futures:
+            self.futures[i] = self.pool.submit(self.build, i)
 
-    # 先按 beat 排序，逐个处理
-    for beat_pos, lane in sorted(level["pattern"], key=lambda x: x[0]):
-        tick = int(round(beat_pos * TICKS))
+    def take(self, i):
+        """The bundle for level i; waits only if its build is still running."""
+        self.want(i)
+        return self.futures[i].result()
 
-        # 若该 tick 已被占用，或与上一颗太近，则顺延（保证不会同拍落两轨）
-        while tick in used_ticks or tick <= last_tick + (MIN_GAP - 1):
-            tick += 1
+    def forget(self, i):
+        """Drop level i's bundle once the level has been edited; want() rebuilds it."""
+        self.futures.pop(i, None)
 
-        # 计算 spawn_time，并保证与上一个 spawn 至少间隔 MIN_TIME_GAP
-        hit_time = (tick / TICKS) * beat_sec
-        spawn_time = max(0.0, hit_time - travel_time)
-        while spawn_time - last_spawn < MIN_TIME_GAP:
-            tick += 1
-            # avoid collisions on ticks as well
-            while tick in used_ticks:
-                tick += 1
-            hit_time = (tick / TICKS) * beat_sec
-            spawn_time = max(0.0, hit_time - travel_time)
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
 
-        used_ticks.add(tick)
-        last_tick = tick
-        last_spawn = spawn_time
+class LevelSnapshot:
+    """
+    A level as start_level leaves it, captured on its first start so that a
+    retry restores it instead of setting it up again. The bundle (layout,
+    compiled chart, tones, song, whose stream keeps its first chunks) is
+    shared read-only; the note field is rewound in place with
+    NoteField.reset(); the duck goes back to its starting lane.
+    """
+    __slots__ = ("bundle","field","duck_idx")
+    def __init__(self, bundle, field, duck_idx):
+        self.bundle = bundle; self.field = field; self.duck_idx = duck_idx
+
+# ================= Frame output =================
+def upscale_to(screen, px):
+    # scale (nearest) straight into the screen, no temporary full-size surface
+    pygame.transform.scale(px, (SCREEN_W, SCREEN_H), screen)
+
+def save_frame(px, frames_dir, index):
+    # the screen is only px scaled up (nearest), so record px at native size;
+    # mux_command() does the same upscale at encode time -> identical video
+    fname = os.path.join(frames_dir, f'frame_{index:05d}.png')
+    pygame.image.save(px, fname)
+
+def mux_command(ffexe, frames_dir, out_mp4, fps=60):
+    return [ffexe, '-y', '-framerate', str(fps), '-i', os.path.join(frames_dir, 'frame_%05d.png'),
+            '-vf', f'scale={SCREEN_W}:{SCREEN_H}:flags=neighbor',
+            '-c:v', 'libx264', '-pix_fmt', 'yuv420p', out_mp4]
+
+# ================= Frame pacing =================
+class FramePacer:
+    """
+    Keeps the main loop on a steady 60 Hz and measures how steady it is.
+
+    modes:
+      "sleep"    - clock.tick(): cheap, but the OS sleep jitters by a few ms
+      "busy"     - clock.tick_busy_loop(): spins the last stretch, precise
+      "adaptive" - busy pacing + `shed` turns True when the frame's own work
+                   gets close to the budget, so callers can skip extras
+      "vsync"    - display flip blocks on vsync; tick() only measures
+      "fixed"    - no waiting at all, dt is always 1/fps (soak runs, tests)
+    For a rhythm game the spread of frame times matters more than the mean,
+    so stats() reports stdev / p99 next to the average.
+    """
+    MODES = ("sleep", "busy", "adaptive", "vsync", "fixed")
+    VSYNC_CAP = 240
+
+    def __init__(self, fps=60, mode="busy", history=240, shed_at=0.8):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown pacing mode {mode!r}, expected one of {self.MODES}")
+        self.fps = fps; self.mode = mode
+        self.budget = 1.0/fps
+        self.shed_at = shed_at
+        self.clock = pygame.time.Clock()
+        self.frame_times = deque(maxlen=history)   # seconds between ticks
+        self.work_times  = deque(maxlen=history)   # seconds spent outside tick()
+        self.shed = False
+        self._tick_end = None
+
+    def tick(self):
+        """Wait for the next frame and return dt in seconds."""
+        start = time.perf_counter()
+        if self._tick_end is not None:
+            self.work_times.append(start - self._tick_end)
+        if self.mode == "fixed":
+            ms = self.clock.tick()
+        elif self.mode == "sleep":
+            ms = self.clock.tick(self.fps)
+        elif self.mode == "vsync":
+            # flip() already waited for the display; the cap only matters on
+            # drivers that accept vsync=1 but don't actually block
+            ms = self.clock.tick(self.VSYNC_CAP)
+        else:
+            ms = self.clock.tick_busy_loop(self.fps)
+        now = time.perf_counter()
+        if self._tick_end is None:
+            dt = ms/1000.0   # includes all of startup; keep it out of the stats
+        else:
+            # clock.tick() rounds to whole ms; perf_counter keeps the sub-ms part
+            dt = now - self._tick_end
+            self.frame_times.append(dt)
+        if self.mode == "fixed":
+            dt = self.budget
+        self._tick_end = now
+        if self.mode == "adaptive" and self.work_times:
+            # look at the last few frames so one hitch doesn't flip-flop the flag
+            recent = list(self.work_times)[-8:]
+            self.shed = sum(recent)/len(recent) >= self.shed_at*self.budget
+        return dt
+
+    def stats(self):
+        ft = sorted(self.frame_times)
+        if not ft:
+            return dict(frames=0, mean_ms=0.0, stdev_ms=0.0, var_ms2=0.0, p99_ms=0.0, work_ms=0.0, fps=0.0)
+        mean = sum(ft)/len(ft)
+        var = sum((x-mean)**2 for x in ft)/len(ft)
+        work = (sum(self.work_times)/len(self.work_times)) if self.work_times else 0.0
+        return dict(
+            frames=len(ft), mean_ms=mean*1000, stdev_ms=math.sqrt(var)*1000, var_ms2=var*1e6,
+            p99_ms=ft[min(len(ft)-1, int(len(ft)*0.99))]*1000, work_ms=work*1000,
+            fps=(1.0/mean) if mean > 0 else 0.0,
+        )
+
+    def report(self):
+        st = self.stats()
+        return (f"pacing={self.mode} frames={st['frames']} mean={st['mean_ms']:.2f}ms "
+                f"stdev={st['stdev_ms']:.2f}ms var={st['var_ms2']:.3f}ms^2 p99={st['p99_ms']:.2f}ms "
+                f"work={st['work_ms']:.2f}ms fps={st['fps']:.1f}")
+
+def open_display(vsync=False):
+    """Create the window; with vsync=True ask SDL for a vsynced SCALED display.
+
+    Returns (screen, vsync_active). Falls back to a plain window when the
+    driver refuses vsync.
+    """
+    if vsync:
+        try:
+            return pygame.display.set_mode((SCREEN_W, SCREEN_H), pygame.SCALED, vsync=1), True
+        except pygame.error as e:
+            print('vsync unavailable, falling back:', e)
+    return pygame.display.set_mode((SCREEN_W, SCREEN_H)), False
+
+def arg_value(name, default=None):
+    """Value of a `--name=value` / `--name value` command-line flag."""
+    for i, a in enumerate(sys.argv):
+        if a.startswith(name + '='):
+            return a.split('=', 1)[1]
+        if a == name and i+1 < len(sys.argv):
+            return sys.argv[i+1]
+    return default
+
+# ================= Render thread =================
+SIM_HZ = 240                # simulation ticks per second with --render-thread
+SWITCH_INTERVAL = 0.001     # s the renderer may hold the interpreter before the simulation gets it back
+
+class FrameState:
+    """
+    What one simulated frame looks like: everything drawing needs and none of
+    the live game objects. main() fills a new one per simulation tick and
+    never touches it once published, so the renderer can draw it on another
+    thread while the simulation moves on. `notes` holds
+    (sprite key, hold key, x, tail x, y) per on-screen note.
+    """
+    __slots__ = ("state","level_idx","info","laneYs","notes","duck","score","label",
+                 "style","muted","hp","flash","night","fade","grey","edit","loop_xs",
+                 "practice","hover","unlocked","best","bests","stars","show_timing")
 
-        schedule.append({"spawn": spawn_time, "lane": lane})
+class FrameBuffer:
+    """
+    Double buffer between the simulation and the renderer. publish() puts a
+    frame in the back slot, replacing any frame not yet drawn; take() swaps
+    the back frame to the front and returns it, waiting while there is
+    nothing newer than the frame last taken. A slow renderer skips frames
+    instead of queueing them, so it never delays the simulation.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.front = self.back = None
+        self.closed = False
+
+    def publish(self, frame):
+        with self.cond:
+            self.back = frame
+            self.cond.notify()
+
+    def take(self, block=True):
+        """The newest frame; None once closed, or if block=False and there is nothing new."""
+        with self.cond:
+            if block:
+                self.cond.wait_for(lambda: self.back is not None or self.closed)
+            if self.closed or self.back is None: return None
+            self.front, self.back = self.back, None
+            return self.front
+
+    def in_use(self):
+        """(front, back): the frame last taken and the one waiting, either may be None."""
+        with self.cond:
+            return self.front, self.back
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+class RenderThread:
+    """
+    Draws published FrameStates on its own thread, paced by `pacer`, while
+    input, spawning and judgement keep their own rate on the main thread.
+    draw(frame, canvas) paints a frame on one of `canvases` and returns the
+    palette effects to present it with; it must only read the frame and
+    objects the renderer owns. Finished canvases go back through a second
+    FrameBuffer: the main thread takes them with ready() and presents them
+    itself, as SDL wants every window call on the main thread. With three
+    canvases one is always free of the shown and the waiting one.
+    An exception in draw stops the thread and is raised again by check()
+    on the main thread.
+    """
+    def __init__(self, draw, canvases, pacer):
+        self.draw = draw; self.canvases = canvases; self.pacer = pacer
+        self.frames = FrameBuffer()     # FrameStates in
+        self.shown = FrameBuffer()      # (canvas, fx) out
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="render", daemon=True)
+        self.thread.start()
 
-    # 已按顺序生成；返回给主循环使用
-    return schedule
+    def publish(self, frame):
+        self.frames.publish(frame)
+
+    def ready(self):
+        """(canvas, fx) drawn since the last call, or None."""
+        return self.shown.take(block=False)
+
+    def check(self):
+        if self.error is not None: raise self.error
+
+    def stop(self):
+        self.frames.close()
+        self.thread.join(timeout=5)
+
+    def _free_canvas(self):
+        busy = [c for c, _ in filter(None, self.shown.in_use())]
+        return next(c for c in self.canvases if all(c is not b for b in busy))
+
+    def _run(self):
+        try:
+            while True:
+                self.pacer.tick()
+                frame = self.frames.take()
+                if frame is None: return
+                canvas = self._free_canvas()
+                self.shown.publish((canvas, self.draw(frame, canvas)))
+        except Exception as e:
+            self.error = e
+
+# ================= Indexed palette =================
+# With --indexed the canvas is an 8-bit surface: one byte per pixel for every
+# fill, blit and recorded frame. Every colour the game draws owns a palette
+# slot, so effects only recolour the 256 entries instead of redrawing pixels.
+UI_COLORS = [(10,10,10), (20,20,20), (100,100,100), (150,120,0), (180,180,180),
+             (200,160,0), (210,210,210), (230,230,230), (255,255,255), (255,215,0),
+             (46,204,113), (243,156,18), (231,76,60), (255,80,80)]
+HP_FLASH = ((231,76,60), (255,80,80))   # low-HP segment colour, off/on
+NIGHT = {C_BG: (70,84,128), C_CITY: (44,52,86), C_LINE: (84,104,150)}
+FADE_T      = 0.4    # level start: fade in from black
+MISS_GREY_T = 0.25   # a miss drains the scene colours for this long
+
+class IndexedPalette:
+    """
+    Slot table for the 8-bit canvas plus the palette effects.
+    Pixels are drawn with the base colours (fills and 8-bit blits are mapped by
+    exact colour); effects() builds the recoloured table the presenter shows.
+    """
+    def __init__(self):
+        scene = [C_BG, C_CITY, C_LINE]
+        colors = scene + [zone_over(c) for c in scene] + [C_DUCK, C_BEAK, C_EYE, C_NOTE, C_MISS, C_INFO]
+        colors = list(dict.fromkeys(colors + UI_COLORS + [SPRITE_KEY]))
+        # virtual slot after the real ones: exact-colour lookups never land on it
+        self.flash = len(colors)
+        colors.append(HP_FLASH[0])
+        self.slot = {c: i for i, c in enumerate(colors)}
+        self.base = np.zeros((256, 3), np.float32)
+        self.base[:len(colors)] = colors
+        self.night = self.base.copy()
+        for c, n in NIGHT.items():
+            self.night[self.slot[c]] = n
+            self.night[self.slot[zone_over(c)]] = zone_over(n)
+        self.scene = np.array([self.slot[c] for c in scene] + [self.slot[zone_over(c)] for c in scene])
+        self.colors = [tuple(c) for c in self.base.astype(np.uint8)]
+
+    def effects(self, night=False, fade=1.0, grey=0.0, flash=False):
+        """
+        Palette as shown: theme, miss greying of the scene, HP flash, fade from
+        black. None when no effect is on, so most frames swap nothing.
+        """
+        if not (night or fade < 1.0 or grey > 0 or flash):
+            return None
+        pal = (self.night if night else self.base).copy()
+        if grey > 0:
+            sc = pal[self.scene]
+            lum = sc @ np.array([0.299, 0.587, 0.114], np.float32)
+            pal[self.scene] = sc + (lum[:, None] - sc) * grey
+        pal[self.flash] = HP_FLASH[1] if flash else HP_FLASH[0]
+        if fade < 1.0:
+            pal *= max(0.0, fade)
+        return pal.astype(np.uint8).tolist()
+
+    def index_surface(self, surf):
+        """8-bit copy of a true-colour surface, each pixel mapped to the nearest slot.
+
+        SDL's own 32->8 bit conversion goes through a dithered 3-3-2 cube, which
+        would not hit the exact slots.
+        """
+        rgb = pygame.surfarray.array3d(surf).astype(np.int32)
+        packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+        uniq, inv = np.unique(packed, return_inverse=True)
+        u = np.stack([uniq >> 16, (uniq >> 8) & 255, uniq & 255], 1)
+        d = ((u[:, None, :] - self.base[None, :self.flash].astype(np.int32))**2).sum(2)
+        out = pygame.Surface(surf.get_size(), 0, 8)
+        out.set_palette(self.colors)
+        pygame.surfarray.blit_array(out, np.argmin(d, 1).astype(np.uint8)[inv.reshape(packed.shape)])
+        return out
+
+# ================= Presentation =================
+# Static sprites are rendered once with the draw_* helpers above and then
+# either blitted onto the pixel canvas (software) or uploaded as textures
+# (renderer). Keys: ("note", style, miss), ("hold", miss), ("duck", mouth)
+SPRITE_KEY = (255,0,255)   # colorkey; never used by the palette
+
+def make_sprite(draw, pad=24):
+    """Render draw(surface, ax, ay) around an anchor and crop to the drawn pixels.
+
+    Returns (surface, ox, oy): blit at (x-ox, y-oy) to put the anchor on (x, y).
+    """
+    surf = pygame.Surface((pad*2, pad*2))
+    surf.fill(SPRITE_KEY); surf.set_colorkey(SPRITE_KEY)
+    draw(surf, pad, pad)
+    r = surf.get_bounding_rect()
+    return surf.subsurface(r).copy(), pad - r.x, pad - r.y
+
+def build_sprite(key):
+    kind = key[0]
+    if kind == "note":
+        _, style, miss = key
+        fn = draw_cloud if style == "cloud" else draw_sun
+        return make_sprite(lambda s, x, y: fn(s, x, y, miss))
+    if kind == "hold":
+        # hold body: a strip as wide as the canvas, cut (software) or
+        # stretched (renderer) to length by span()
+        surf = pygame.Surface((PX_W+16, HOLD_THK))
+        surf.fill(C_MISS if key[1] else C_NOTE)
+        return surf, 0, HOLD_THK//2
+    if kind == "duck":
+        return make_sprite(lambda s, x, y: draw_duck(s, x, y, mouth=key[1]))
+    raise KeyError(key)
+
+def note_sprite_key(miss):
+    return ("note", GAME_CFG.note_style, bool(miss))
+
+def hold_sprite_key(miss):
+    return ("hold", bool(miss))
+
+class SoftwarePresenter:
+    """
+    CPU path: sprites are blitted into the canvas, which is scaled and flipped.
+    indexed=True draws on an 8-bit canvas whose palette the frame's effects
+    replace right before presenting; begin() puts the base palette back.
+    """
+    name = "software"
+
+    def __init__(self, vsync=False, indexed=False):
+        self.screen, self.vsync = open_display(vsync)
+        self.sprites = {}
+        self.palette = IndexedPalette() if indexed else None
+        self.swapped = set()    # canvases presented with an effects palette
+        # the 8 -> 32 bit conversion happens here, at canvas size, before the upscale
+        self.rgb = pygame.Surface((PX_W,PX_H)).convert() if indexed else None
+
+    def make_canvas(self):
+        if self.palette:
+            return self.make_layer(PX_W, PX_H, key=False)
+        return pygame.Surface((PX_W,PX_H)).convert()
+
+    def make_layer(self, w, h, key=True):
+        """Surface to draw into and blit onto the canvas (transparent where keyed)."""
+        if not self.palette:
+            return pygame.Surface((w,h), pygame.SRCALPHA)
+        surf = pygame.Surface((w,h), 0, 8)
+        surf.set_palette(self.palette.colors)
+        if key: surf.set_colorkey(SPRITE_KEY)
+        return surf
+
+    def _sprite(self, key):
+        spr = self.sprites.get(key)
+        if spr is None:
+            surf, ox, oy = build_sprite(key)
+            if self.palette:
+                ck = surf.get_colorkey()
+                surf = self.palette.index_surface(surf)
+                if ck: surf.set_colorkey(ck[:3])
+            spr = self.sprites[key] = (surf, ox, oy)
+        return spr
+
+    def sprite(self, px, key, x, y):
+        surf, ox, oy = self._sprite(key)
+        px.blit(surf, (x-ox, y-oy))
+
+    def span(self, px, key, x0, x1, y):
+        """Strip sprite from x0 to x1 on row y, as one blit of its first x1-x0 columns."""
+        surf, _, oy = self._sprite(key)
+        if x1 > x0:
+            px.blit(surf, (x0, y-oy), (0, 0, x1-x0, surf.get_height()))
+
+    def begin(self, px):
+        # fills and blits map colours through the canvas palette: draw with the base one
+        if px in self.swapped:
+            px.set_palette(self.palette.colors); self.swapped.discard(px)
+
+    def top(self, px):
+        """Surface for what is drawn above the sprites (HUD, overlays): the canvas."""
+        return px
+
+    def present(self, px, fx=None):
+        if fx is not None:
+            px.set_palette(fx); self.swapped.add(px)
+        if self.rgb is not None:
+            self.rgb.blit(px, (0,0)); px = self.rgb
+        upscale_to(self.screen, px)
+        pygame.display.flip()
+
+class RendererPresenter:
+    """
+    SDL2 renderer path (pygame._sdl2.video): the canvas is uploaded once per
+    frame into a streaming texture and the renderer does the nearest-neighbour
+    upscale; sprites live as textures drawn on top of it. What goes above the
+    sprites is drawn on a transparent layer, uploaded as a second texture.
+    Needs an accelerated driver - raises so make_presenter() can fall back.
+    """
+    name = "renderer"
+
+    def __init__(self, vsync=False, accelerated=True):
+        from pygame._sdl2 import video
+        os.environ.setdefault("SDL_RENDER_SCALE_QUALITY", "0")   # nearest
+        self.video = video
+        self.window = video.Window("Rhythm Duck – PFAD A3", size=(SCREEN_W, SCREEN_H))
+        try:
+            # any failure from here on must not leave the window open behind the fallback
+            self.renderer = video.Renderer(self.window, accelerated=1 if accelerated else -1, vsync=vsync)
+            self.canvas_tex = video.Texture(self.renderer, (PX_W,PX_H), streaming=True)
+            self.top_tex = video.Texture(self.renderer, (PX_W,PX_H), streaming=True)
+            self.top_tex.blend_mode = 1     # SDL_BLENDMODE_BLEND
+        except Exception:
+            self.window.destroy()
+            raise
+        self.vsync = vsync
+        self.screen = None
+        self.top_layer = pygame.Surface((PX_W,PX_H), pygame.SRCALPHA)
+        self.textures = {}
+        self.queue = []
+
+    palette = None   # true-colour only; --indexed selects the software path
+
+    def make_canvas(self):
+        return pygame.Surface((PX_W,PX_H))
+
+    def make_layer(self, w, h):
+        return pygame.Surface((w,h), pygame.SRCALPHA)
+
+    def sprite(self, px, key, x, y):
+        tex = self.textures.get(key)
+        if tex is None:
+            surf, ox, oy = build_sprite(key)
+            tex = self.textures[key] = (self.video.Texture.from_surface(self.renderer, surf), ox, oy)
+        t, ox, oy = tex
+        self.queue.append((t, None, ((x-ox)*SCALE, (y-oy)*SCALE, t.width*SCALE, t.height*SCALE)))
+
+    def span(self, px, key, x0, x1, y):
+        """Strip sprite from x0 to x1: its first column stretched by the renderer."""
+        tex = self.textures.get(key)
+        if tex is None:
+            surf, ox, oy = build_sprite(key)
+            tex = self.textures[key] = (self.video.Texture.from_surface(self.renderer, surf), ox, oy)
+        t, _, oy = tex
+        if x1 > x0:
+            self.queue.append((t, (0, 0, 1, t.height), (x0*SCALE, (y-oy)*SCALE, (x1-x0)*SCALE, t.height*SCALE)))
+
+    def begin(self, px):
+        self.top_layer.fill((0,0,0,0))
+
+    def top(self, px):
+        """Surface for what is drawn above the sprites (HUD, overlays)."""
+        return self.top_layer
+
+    def present(self, px, fx=None):
+        self.canvas_tex.update(px)
+        self.top_tex.update(self.top_layer)
+        self.renderer.clear()
+        self.canvas_tex.draw(dstrect=(0, 0, SCREEN_W, SCREEN_H))
+        for t, src, dst in self.queue:
+            t.draw(srcrect=src, dstrect=dst)
+        self.queue.clear()
+        self.top_tex.draw(dstrect=(0, 0, SCREEN_W, SCREEN_H))
+        self.renderer.present()
+
+def make_presenter(kind="software", vsync=False, indexed=False):
+    """kind: "software", "renderer" or "auto" (renderer if accelerated, else software)."""
+    if indexed:
+        return SoftwarePresenter(vsync, indexed=True)
+    if kind in ("renderer", "auto"):
+        try:
+            return RendererPresenter(vsync)
+        except Exception as e:
+            print('renderer backend unavailable, using software path:', e)
+    elif kind != "software":
+        raise ValueError(f"unknown presenter {kind!r}")
+    return SoftwarePresenter(vsync)
+
+# ================= HUD =================
+class HudLayer:
+    """
+    HUD widgets composited into one transparent canvas-sized layer.
+    update() gets every widget's inputs and redraws only the widgets whose
+    inputs changed (and the ones overlapping them), so an unchanged frame
+    costs the single blit in draw().
+    Widgets are drawn on `canvas`; what is blitted is an RLE-encoded copy,
+    whose empty runs cost nothing. Drawing into an RLE surface would decode
+    and re-encode it on every fill, hence the copy per change.
+    """
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.empty = canvas.get_colorkey() or (0,0,0,0)
+        canvas.fill(self.empty)
+        self.widgets = []   # (name, rect, draw) in drawing order
+        self.keys = {}      # name -> inputs it was last drawn with
+        self.layer = None
+
+    def add(self, name, rect, draw):
+        """draw(surface, key) paints the widget inside rect; a key of None hides it."""
+        self.widgets.append((name, pygame.Rect(rect), draw))
+
+    def update(self, keys, hold=()):
+        """Redraw widgets whose key changed; names in `hold` keep what they show."""
+        dirty = [r for name, r, _ in self.widgets
+                 if name in keys and keys[name] != self.keys.get(name)
+                 and not (name in hold and name in self.keys)]
+        if not dirty:
+            return
+        for name in keys:
+            if not (name in hold and name in self.keys):
+                self.keys[name] = keys[name]
+        canvas = self.canvas
+        for area in dirty:
+            canvas.set_clip(area)
+            canvas.fill(self.empty, area)
+            for name, r, draw in self.widgets:
+                key = self.keys.get(name)
+                if key is not None and r.colliderect(area):
+                    draw(canvas, key)
+        canvas.set_clip(None)
+        layer = canvas.copy()
+        if layer.get_colorkey():
+            layer.set_colorkey(layer.get_colorkey(), pygame.RLEACCEL)
+        else:
+            layer.set_alpha(255, pygame.RLEACCEL)
+        self.layer = layer
+
+    def draw(self, px):
+        if self.layer is None:
+            return
+        if px.get_flags() & pygame.SRCALPHA:
+            # a transparent target (the renderer's top layer): pygame's own
+            # alpha blit copies where the target is clear, SDL's RLE blit
+            # would darken the text edges against it
+            px.blit(self.canvas, (0,0))
+        else:
+            px.blit(self.layer, (0,0))
+
+def game_hud(layer, r_style, r_music, r_exit):
+    """The in-game HUD widgets, in drawing order; main() sets their keys every frame."""
+    hud = HudLayer(layer)
+    hud.add("info", (0,0,150,16), lambda s, k: px_text(s, f"Lv{k[0]+1} BPM{k[1]} L{k[2]}", 6, 4))
+    hud.add("score", (0,16,150,16), lambda s, k: px_text(s, f"SCORE: {k}", 6, 16))
+    hud.add("label", (PX_W-64,0,64,20), lambda s, k: px_text(s, k, PX_W-60, 6, color=(255,215,0)))
+    hud.add("style", r_style, lambda s, k: btn_style_toggle(s, r_style))
+    hud.add("music", r_music, lambda s, k: btn_speaker(s, r_music, muted=k))
+    hud.add("eject", r_exit, lambda s, k: btn_eject(s, r_exit))
+    hud.add("hp", HP_RECT, lambda s, k: draw_hp(s, *k))
+    return hud
+
+# ================= Soak test =================
+def current_rss():
+    """Resident set size in bytes (peak RSS where /proc is unavailable, 0 if unknown)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak*1024
+    except ImportError:
+        return 0
+
+class AutoPilot:
+    """
+    Feeds synthetic input into main() for unattended soak runs. One cycle is
+    menu -> select -> play without input (usually fails) -> retry with
+    auto-play -> pass -> home, rotating through the unlocked levels.
+    """
+    DWELL = 20   # frames to stay on each screen so its drawing gets exercised
+
+    def __init__(self, cycles, r_home):
+        self.cycles = cycles
+        self.cycle = 0
+        self.auto_play = False
+        self.r_home = r_home
+        self.state = None
+        self.frames_in_state = 0
+
+    def done(self):
+        return self.cycle >= self.cycles
+
+    def _click(self, r):
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(r.centerx*SCALE, r.centery*SCALE))
+
+    def _key(self, k):
+        return pygame.event.Event(pygame.KEYDOWN, key=k, mod=0, unicode='', scancode=0)
+
+    def events(self, state, unlocked):
+        if state != self.state:
+            if state == "menu" and self.state == "pass":
+                self.cycle += 1
+            if state == "menu":
+                self.auto_play = False
+            self.state = state; self.frames_in_state = 0
+        self.frames_in_state += 1
+        if state == "playing" or self.frames_in_state < self.DWELL:
+            return []
+        if state == "menu":
+            return [self._key(pygame.K_SPACE)]
+        if state == "select":
+            return [self._click(level_rect(min(self.cycle % len(LEVELS), unlocked-1)))]
+        if state == "fail":
+            self.auto_play = True
+            return [self._key(pygame.K_RETURN)]
+        if state == "pass":
+            return [self._click(self.r_home)]
+        return []
+
+class SoakMonitor:
+    """Samples tracemalloc and RSS once per cycle and reports growth."""
+
+    def __init__(self, warmup=1, frames=25, top=10):
+        # the first `warmup` cycles fill sprite/font/sound caches (one pass
+        # over every level), so growth is measured from the end of them
+        self.warmup = warmup
+        self.top = top
+        tracemalloc.start(frames)
+        self.samples = []        # (cycle, traced bytes, rss bytes, seconds)
+        self.base_snapshot = None
+        self.started = time.perf_counter()
+
+    def sample(self, cycle):
+        gc.collect()
+        traced, _peak = tracemalloc.get_traced_memory()
+        self.samples.append((cycle, traced, current_rss(), time.perf_counter()-self.started))
+        if cycle == self.warmup:
+            self.base_snapshot = tracemalloc.take_snapshot()
+        print(f"[soak] cycle {cycle}: traced {traced/1e6:.2f} MB, rss {self.samples[-1][2]/1e6:.1f} MB")
+
+    def report(self):
+        lines = ["[soak] ---- report ----"]
+        steady = [smp for smp in self.samples if smp[0] >= self.warmup]
+        if len(steady) < 2:
+            lines.append(f"[soak] need at least {self.warmup+1} cycles for growth figures")
+            return "\n".join(lines)
+        c0, tr0, rss0, _ = steady[0]
+        c1, tr1, rss1, secs = steady[-1]
+        n = c1 - c0
+        lines.append(f"[soak] {c1} cycles in {secs:.1f}s, growth measured over cycles {c0}-{c1}")
+        lines.append(f"[soak] traced: {tr0/1e6:.2f} -> {tr1/1e6:.2f} MB, {(tr1-tr0)/n/1024:+.1f} KiB/cycle")
+        lines.append(f"[soak] rss:    {rss0/1e6:.1f} -> {rss1/1e6:.1f} MB, {(rss1-rss0)/n/1024:+.1f} KiB/cycle")
+        if self.base_snapshot is not None:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+            snap = tracemalloc.take_snapshot().filter_traces(filters)
+            stats = snap.compare_to(self.base_snapshot.filter_traces(filters), 'lineno')
+            lines.append(f"[soak] top allocation sites since cycle {self.warmup}:")
+            for st in stats[:self.top]:
+                lines.append(f"[soak]   {st.size_diff/1024:+9.1f} KiB {st.count_diff:+6d} blocks  {st.traceback[0]}")
+        return "\n".join(lines)
 
 # ----------------- Scoring -----------------
 def score_for_hit(offset):
@@ -360,21 +2393,158 @@ def score_for_hit(offset):
         return "Good", 80
     return "OK", 30
 
-def load_best_score():
+JUDGEMENTS = ("Perfect", "Great", "Good", "OK")
+HOLD_TICK_POINTS = 10   # per quarter beat sustained
+
+def stars_for_misses(m):
+    if m == 0: return 3
+    if m in (1,2): return 2
+    if m == 3: return 1
+    return 0
+
+def load_best_score(path='best_score.txt'):
+    # legacy single-integer file from before the score store, see ScoreStore.import_legacy()
     try:
-        with open('best_score.txt','r') as f:
+        with open(path,'r') as f:
             return int(f.read().strip() or 0)
     except Exception:
         return 0
 
-def save_best_score(v):
-    try:
-        with open('best_score.txt','w') as f:
-            f.write(str(int(v)))
-    except Exception:
-        pass
+class ScoreStore:
+    """
+    Every finished run (level, score, stars, misses, judgement histogram) in a
+    SQLite database in WAL mode. record() only updates an in-memory best table
+    and queues the row; a writer thread commits queued rows in batches, so the
+    pass screen never waits on disk. Best-per-level comes from that table
+    (loaded once at startup with an indexed GROUP BY). The meta table holds
+    values that are not runs, such as the best score imported from the old
+    best_score.txt.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL, session TEXT NOT NULL, level TEXT NOT NULL,
+            passed INTEGER NOT NULL, score INTEGER NOT NULL, stars INTEGER NOT NULL,
+            misses INTEGER NOT NULL,
+            perfect INTEGER NOT NULL, great INTEGER NOT NULL, good INTEGER NOT NULL, ok INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_level_score ON runs(level, score);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    """
+    BATCH = 64
+
+    def __init__(self, path='scores.db'):
+        self.path = path
+        self.session = time.strftime('%Y%m%d_%H%M%S')
+        self._best = {}       # level -> (score, stars)
+        self.legacy_best = None     # from best_score.txt, once imported
+        self._q = queue.Queue()
+        try:
+            con = self._connect()
+            con.executescript(self.SCHEMA)
+            for level, best, stars in con.execute(
+                    "SELECT level, MAX(score), MAX(stars) FROM runs GROUP BY level"):
+                self._best[level] = (best, stars)
+            row = con.execute("SELECT value FROM meta WHERE key='legacy_best'").fetchone()
+            if row: self.legacy_best = row[0]
+            con.close()
+        except sqlite3.Error as e:
+            # unwritable directory etc.: keep scores for this session only
+            print('score store unavailable, not persisting:', e)
+            self.path = None
+        self._writer = threading.Thread(target=self._write_loop, name="score-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        con = sqlite3.connect(self.path, timeout=5)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def record(self, level, passed, score, stars, misses, judgements):
+        old = self._best.get(level, (0, 0))
+        self._best[level] = (max(old[0], score), max(old[1], stars))
+        self._q.put((time.time(), self.session, level, int(passed), score, stars, misses,
+                     *(judgements.get(j, 0) for j in JUDGEMENTS)))
+
+    def best(self, level):
+        """(best score, best stars) for a level name, (0, 0) if never played."""
+        return self._best.get(level, (0, 0))
+
+    def best_overall(self):
+        """Best score of any level, or the imported best_score.txt if higher."""
+        return max([b for b, _ in self._best.values()] + [self.legacy_best or 0])
+
+    def import_legacy(self, path='best_score.txt'):
+        """Copy the old best_score.txt into the meta table, unless an earlier
+        start already did. It has no level, so it is not a run."""
+        if self.legacy_best is not None:
+            return
+        best = load_best_score(path)
+        if best <= 0:
+            return
+        self.legacy_best = best
+        if self.path is None:
+            return
+        try:
+            con = self._connect()
+            with con:
+                con.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('legacy_best', ?)", (best,))
+            con.close()
+        except sqlite3.Error as e:
+            print('score store write failed:', e)
+
+    def close(self):
+        """Flush queued runs and stop the writer."""
+        self._q.put(None)
+        self._writer.join(timeout=5)
+
+    def _write_loop(self):
+        con = None
+        if self.path is not None:
+            try:
+                con = self._connect()
+            except sqlite3.Error as e:
+                print('score store unavailable, not persisting:', e)
+        while True:
+            item = self._q.get()
+            batch = []
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            # drain whatever else is already waiting into the same transaction
+            while not stop and len(batch) < self.BATCH:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None: stop = True
+                else: batch.append(item)
+            if batch and con is not None:
+                try:
+                    with con:
+                        con.executemany(
+                            "INSERT INTO runs (ts, session, level, passed, score, stars, misses,"
+                            " perfect, great, good, ok) VALUES (?,?,?,?,?,?,?,?,?,?,?)", batch)
+                except sqlite3.Error as e:
+                    print('score store write failed:', e)
+            if stop:
+                break
+        if con is not None:
+            con.close()
 
 # ================= Main =================
+def init_pygame():
+    """
+    Start only the subsystems the game uses. pygame.init() also brings up
+    joystick, camera and the rest, and probing those can take a noticeable
+    part of a cold start on some machines. Every sound is synthesized into
+    mixer-owned buffers, so unlike pygame.init() a missing audio device
+    stops the game here with the mixer's own error.
+    """
+    pygame.display.init(); pygame.font.init()
+    pygame.mixer.init()
+
 def main():
     global GAME_CFG
     # replace globals with config usage
@@ -382,12 +2552,69 @@ def main():
     # command-line flags
     record_mode = ('--record' in sys.argv) or ('--auto-record' in sys.argv)
     frames_dir = None
-    pygame.mixer.pre_init(SR, size=16, channels=2, buffer=1024)
-    pygame.init(); pygame.font.init()
-    screen=pygame.display.set_mode((SCREEN_W, SCREEN_H))
+    want_vsync = '--vsync' in sys.argv
+    # simulation on the main thread, drawing on another (software path only:
+    # renderer textures belong to the thread that made them)
+    render_thread = '--render-thread' in sys.argv
+    if render_thread and record_mode:
+        # a recording needs one frame per 1/60 s of song time; the render thread skips frames
+        print('--render-thread is not used with --record')
+        render_thread = False
+    if render_thread and want_vsync:
+        # presenting stays on the main thread, where a vsynced flip would stall the simulation
+        print('--vsync is not used with --render-thread')
+        want_vsync = False
+    pacing = arg_value('--pacing', 'vsync' if want_vsync else 'busy')
+    show_timing = '--show-timing' in sys.argv
+    soak_cycles = int(arg_value('--soak', 0) or 0)
+    if soak_cycles and pacing == 'busy' and arg_value('--pacing') is None:
+        pacing = 'fixed'   # soak runs as fast as the CPU allows unless told otherwise
+    # --chart-from song.wav: add a level generated from the file's onsets
+    chart_wav = arg_value('--chart-from')
+    if chart_wav:
+        generated = chart_from_wav(chart_wav, lanes=int(arg_value('--lanes', 3)))
+        if '--emit-chart' in sys.argv:
+            print(repr(generated)); sys.exit(0)
+        LEVELS.append(generated)
+    if '--analyze' in sys.argv:
+        print_level_analysis(LEVELS); sys.exit(0)
+    # recording reads the canvas, which only has the sprites on the software path
+    present_kind = 'software' if record_mode or render_thread else arg_value('--present', 'software')
+    indexed = '--indexed' in sys.argv
+    GAME_CFG.theme = arg_value('--theme', GAME_CFG.theme)
+    if GAME_CFG.theme != "day" and not indexed:
+        # themes are palettes: the true-colour canvas has nothing to recolour
+        print('--theme is only used with --indexed')
+        GAME_CFG.theme = "day"
+    pygame.mixer.pre_init(SR, size=-16, channels=mixer_channels(LEVELS), buffer=1024)
+    init_pygame()
+    presenter = make_presenter(present_kind, want_vsync, indexed)
+    palette = presenter.palette
+    screen = presenter.screen
+    if pacing == 'vsync' and not presenter.vsync:
+        pacing = 'busy'
     pygame.display.set_caption("Rhythm Duck – PFAD A3")
-    clock=pygame.time.Clock()
-    px=pygame.Surface((PX_W,PX_H)).convert()
+    if render_thread:
+        # `pacer` paces what is shown, `sim_pacer` the game. Both sleep: a
+        # busy-waiting thread would keep the interpreter from the other one
+        pacer = FramePacer(60, "fixed" if pacing == "fixed" else "sleep")
+        sim_pacer = FramePacer(SIM_HZ, "fixed" if pacing == "fixed" else "sleep")
+        sys.setswitchinterval(SWITCH_INTERVAL)
+    else:
+        pacer = sim_pacer = FramePacer(60, pacing)
+    renderer = None     # RenderThread, started with the main loop
+
+    soak = SoakMonitor(warmup=len(LEVELS)) if soak_cycles else None
+
+    def quit_game():
+        if renderer: renderer.stop()
+        store.close()
+        prefetch.shutdown()
+        print(pacer.report())
+        if sim_pacer is not pacer: print('simulation', sim_pacer.report())
+        if soak: print(soak.report())
+        pygame.quit(); sys.exit(0)
+    px=presenter.make_canvas()
 
     if record_mode:
         ts = time.strftime('%Y%m%d_%H%M%S')
@@ -397,42 +2624,159 @@ def main():
         os.makedirs(frames_dir, exist_ok=True)
         print('Recording frames to', frames_dir)
         frames_muxed = False
+        frames_saved = 0
         # used to ensure frames finished writing before mux
         frames_last_count = 0
         frames_last_stable_since = None
 
-    lane_sounds=[square_sound(f,0.24,VOL) for f in LANE_FREQS]
+    tone_cache={}   # freq -> Sound, shared by every level using that lane tone
+    def lane_tones(n):
+        out=[]
+        for f in lane_freqs(n):
+            if f not in tone_cache: tone_cache[f]=square_sound(f,0.24,VOL)
+            out.append(tone_cache[f])
+        return out
     sfx_eat=noise_click(0.05,0.45)
 
     bg_ch=pygame.mixer.Channel(0)
-    def play_bg(bpm):
-        snd=bg_song_twinkle(bpm)
-        if not GAME_CFG.muted: bg_ch.play(snd, loops=-1)
-        else: bg_ch.stop()
+    bg_cache={}   # bpm -> Sound; the song only depends on bpm
+    def bg_song_for(bpm):
+        snd=bg_cache.get(bpm)
+        if snd is None:
+            snd=bg_cache[bpm]=bg_song_twinkle(bpm)
+        return snd
+    bg_track=None    # Sound or PcmStream of the current level (LevelBundle.bg)
+    bg_stream=None   # bg_track while it is a PcmStream being fed to the mixer
+    def play_bg(track, at=0.0):
+        nonlocal bg_stream
+        stop_bg()
+        if GAME_CFG.muted: return
+        if isinstance(track, PcmStream):
+            bg_stream = track; track.play(bg_ch, at)
+        else:
+            bg_ch.play(track, loops=-1)
+    def stop_bg():
+        nonlocal bg_stream
+        if bg_stream: bg_stream.stop(); bg_stream = None
+        bg_ch.stop()
+    def toggle_music():
+        GAME_CFG.muted = not GAME_CFG.muted
+        if GAME_CFG.muted: stop_bg()
+        elif state in ("playing", "practice", "edit"): play_bg(bg_track, t)
+        else: play_bg(bg_song_for(lvl["bpm"]))
+
+    prefetch = LevelPrefetcher(lambda i: build_level_bundle(i, lane_tones, bg_song_for))
+    snapshots = {}      # level index -> LevelSnapshot from its first start
 
     state="menu"; unlocked=1; level_idx=0
     lvl=LEVELS[level_idx]; laneYs=lane_ys_for(lvl["lanes"])
+    lane_sounds=lane_tones(lvl["lanes"])
     duck=Duck(laneYs)
 
     # scoring
     score = 0
     last_hit_label = None
-    best_score = load_best_score()
+    store = ScoreStore(arg_value('--scores', 'scores.db'))
+    store.import_legacy()
+    judgements = dict.fromkeys(JUDGEMENTS, 0)
+    level_stars = 0
+
+    editor=None; edit_lane=0; edits=0   # chart editor (LiveSchedule of the edited level)
+    practice_rate=1.0; loop_a=loop_b=None; practice_tmap=None   # practice mode (A-B loop in beats)
+    miss_count=0; t=0.0; flash_t=0.0
+    hover=None      # level button under the mouse on the select screen
+    fade_t=FADE_T; grey_t=0.0   # palette effects (indexed canvas)
+    notes=NoteField(laneYs)
 
-    miss_count=0; t=0.0; upcoming=[]; notes=[]; flash_t=0.0
+    prefetch.want(level_idx)
 
     def start_level(i):
-        nonlocal lvl, laneYs, t, upcoming, notes, miss_count, score, last_hit_label
-        lvl = LEVELS[i]
-        laneYs = lane_ys_for(lvl["lanes"])
-        duck.set_lanes(laneYs)
+        nonlocal lvl, laneYs, lane_sounds, t, notes, miss_count, score, last_hit_label, judgements, bg_track, fade_t
+        snap = snapshots.get(i)
+        notes.clear()
+        if snap is None:
+            b = prefetch.take(i)
+            duck.set_lanes(b.laneYs)
+            snap = snapshots[i] = LevelSnapshot(b, NoteField(b.laneYs, b.chart), duck.idx)
+        else:
+            # a retry: same bundle, the field rewound in place, the duck back where it started
+            b = snap.bundle
+            duck.set_lanes(b.laneYs)
+            duck.idx = snap.duck_idx; duck.y = b.laneYs[duck.idx]
+            snap.field.reset()
+        lvl = b.level
+        laneYs = b.laneYs
+        lane_sounds = b.tones
         miss_count = 0
         t = 0.0
-        notes = []
-        upcoming = build_schedule(lvl)
-        play_bg(lvl["bpm"])
+        fade_t = 0.0
+        notes = snap.field
+        bg_track = b.bg
+        play_bg(bg_track)
         score = 0
         last_hit_label = None
+        judgements = dict.fromkeys(JUDGEMENTS, 0)
+
+    def start_editor(i):
+        nonlocal editor, notes, edit_lane, edits
+        start_level(i)
+        editor = LiveSchedule(lvl)
+        notes.clear()
+        notes = NoteField(laneYs, editor.chart())
+        edit_lane = duck.idx; edits = 0
+
+    def leave_editor():
+        stop_bg()
+        notes.clear()
+        if edits:
+            prefetch.forget(level_idx)     # its bundle holds the old chart
+            snapshots.pop(level_idx, None)
+            print(repr(lvl))
+
+    def start_practice(i):
+        nonlocal bg_track, practice_tmap, loop_a, loop_b
+        start_level(i)
+        practice_tmap = TempoMap.for_level(lvl)
+        loop_a = loop_b = None
+        # a stream of its own (bundles are shared), which can seek and change rate
+        if isinstance(bg_track, WavStream):
+            bg_track = WavStream(bg_track.path, bg_track.offset)
+        else:
+            bg_track = PcmStream.from_sound(bg_track)
+        bg_track.rate = practice_rate
+        practice_seek(0.0)
+
+    def practice_seek(beat):
+        """Restart practice with `beat` at the hit line after PRACTICE_LEAD s."""
+        nonlocal t, score, miss_count, last_hit_label, judgements
+        hit = practice_tmap.time_at(max(beat, 0.0))
+        t = max(0.0, hit - PRACTICE_LEAD)
+        notes.seek(t, first_hit=hit)
+        score = 0; miss_count = 0; last_hit_label = None
+        judgements = dict.fromkeys(JUDGEMENTS, 0)
+        play_bg(bg_track, t)
+
+    def practice_key(key):
+        nonlocal practice_rate, loop_a, loop_b
+        at = practice_tmap.beat_at(t)                       # beat at the hit line
+        if key in (pygame.K_LEFT, pygame.K_RIGHT):
+            ahead = practice_tmap.beat_at(t + PRACTICE_LEAD)  # what a seek would put there
+            section = round(ahead / SEEK_BEATS) + (1 if key == pygame.K_RIGHT else -1)
+            practice_seek(max(section, 0) * SEEK_BEATS)
+        elif key in (pygame.K_MINUS, pygame.K_EQUALS):
+            step = RATE_STEP if key == pygame.K_EQUALS else -RATE_STEP
+            practice_rate = round(min(1.0, max(RATE_MIN, practice_rate + step)), 2)
+            bg_track.rate = practice_rate
+            play_bg(bg_track, t)
+        elif key == pygame.K_a:
+            loop_a = math.floor(at)
+            if loop_b is not None and loop_b <= loop_a: loop_b = None
+        elif key == pygame.K_b:
+            b = math.ceil(at)
+            if b > (loop_a or 0):
+                loop_b = b; practice_seek(loop_a or 0)
+        elif key == pygame.K_c:
+            loop_a = loop_b = None
 
     # Pixel buttons (no unicode)
     r_style = pygame.Rect(PX_W-36, 4, 14, 12)
@@ -444,17 +2788,203 @@ def main():
     r_pass_home = pygame.Rect(PX_W//2-56, PX_H//2+6, 52, 18)
     r_pass_next = pygame.Rect(PX_W//2+4, PX_H//2+6, 52, 18)
 
-    while True:
-        dt = clock.tick(60)/1000.0
+    hud = game_hud(presenter.make_layer(PX_W, PX_H), r_style, r_music, r_exit)
+
+    pilot = AutoPilot(soak_cycles, r_pass_home) if soak_cycles else None
+    soak_cycle = 0
+
+    def snapshot(dt):
+        """The FrameState of the game as it is now (advancing the effect timers by dt)."""
+        nonlocal flash_t, fade_t, grey_t
+        flash_t += dt; fade_t += dt; grey_t = max(0.0, grey_t-dt)
+        f = FrameState()
+        f.state = state; f.level_idx = level_idx
+        f.info = (level_idx, lvl['bpm'], lvl['lanes'])
+        f.laneYs = laneYs
+        # sustained holds: the body starts at the duck
+        f.notes = tuple((note_sprite_key(n.missed), hold_sprite_key(n.missed),
+                         HIT_X if notes.held(n) else int(x), int(xe), int(n.y))
+                        for n, x, xe in notes.positions())
+        f.duck = (("duck", duck.mouth>0), int(duck.y))
+        f.score = score; f.label = last_hit_label
+        f.style = GAME_CFG.note_style; f.muted = GAME_CFG.muted
+        f.hp = max(0, HP_SEGMENTS - miss_count*2)
+        f.flash = int(flash_t*6)%2==0
+        f.night = GAME_CFG.theme == "night"
+        f.fade = fade_t/FADE_T; f.grey = grey_t/MISS_GREY_T
+        f.edit = (*editor.cursor(t), edit_lane) if state=="edit" else None
+        f.loop_xs = ()
+        f.practice = (practice_rate, loop_a, loop_b)
+        if state=="practice":
+            # A-B loop points, where they are on screen
+            sc = notes.chart.scroll
+            f.loop_xs = tuple(int(HIT_X + sc.pos(practice_tmap.time_at(b)) - sc.pos(t))
+                              for b in (loop_a, loop_b) if b is not None)
+        f.hover = hover; f.unlocked = unlocked
+        f.best = store.best_overall() if state=="menu" else 0
+        f.bests = tuple(store.best(l["name"]) for l in LEVELS) if state=="select" else ()
+        f.stars = level_stars
+        f.show_timing = show_timing
+        return f
+
+    def draw_frame(f, px):
+        """
+        Draw FrameState f on canvas px, reading nothing else of the game;
+        returns the palette effects to present it with.
+        """
+        presenter.begin(px)
+        draw_bg(px, f.laneYs)
+
+        # notes & duck
+        for key, hold_key, x, xe, y in f.notes:
+            if xe > x: presenter.span(px, hold_key, x, xe, y)
+            presenter.sprite(px, key, x, y)
+        presenter.sprite(px, f.duck[0], HIT_X-6, f.duck[1])
+        # the rest goes above the sprites, which the renderer path only draws when presenting
+        top = presenter.top(px)
+        if f.edit is not None:
+            draw_edit_cursor(top, int(f.edit[1]), f.laneYs, f.edit[2])
+        for x in f.loop_xs:
+            if HIT_X <= x < PX_W:
+                px_rect(top, x, f.laneYs[0]-NOTE_H, 1, f.laneYs[-1]-f.laneYs[0]+2*NOTE_H+1, C_INFO)
+
+        # HUD: info, score, hit label, buttons, HP column (flashes if <=2).
+        # Text is the priciest part, so in adaptive pacing it is kept from the
+        # last frame while over budget
+        if f.hp > 2: low = None
+        elif palette: low = palette.flash     # flashed by the palette, pixels stay put
+        else: low = (255,80,80) if f.flash else (231,76,60)
+        hud.update({
+            "info": f.info,
+            "score": f.score,
+            "label": f.label,
+            "style": f.style,
+            "music": f.muted,
+            "eject": True if f.state in ("playing", "practice", "edit") else None,
+            "hp": (f.hp, low) if low is not None else (f.hp,),
+        }, hold=("info", "score", "label") if pacer.shed else ())
+        hud.draw(top)
+
+        # overlays
+        state, level_idx = f.state, f.level_idx
+        if state=="menu":
+            px_text_center(top, "RHYTHM DUCK // PIXEL", PX_W//2, PX_H//2-28)
+            if f.best:
+                px_text_center(top, f"BEST {f.best}", PX_W//2, PX_H//2-12)
+            btn_play(top, r_start)
+            px_text(top, "W/S or Up/Down  •  Space/Delete  •  M toggle", 12, PX_H-18)
+        elif state=="select":
+            px_text_center(top, "SELECT LEVEL", PX_W//2, 18)
+            for i, (best, best_stars) in enumerate(f.bests):
+                r = level_rect(i)
+                # highlight on hover (clicks are handled with the other mouse events)
+                if i == f.hover:
+                    btn_box(top, r, active=True)
+                else:
+                    btn_box(top, r, active=(i<f.unlocked))
+                px_text(top, f"{i+1}", r.x+26, r.y+6)
+                if best:
+                    px_text(top, f"{best}", r.x+2, r.y+r.h+2, size=10)
+                    for k in range(3):
+                        px_rect(top, r.x+r.w-16+k*6, r.y+r.h+5, 4, 4, (255,215,0) if k < best_stars else (180,180,180))
+            px_text(top, "Space play  P practice  E edit", PX_W//2-62, PX_H-18)
+        elif state=="practice":
+            rate, loop_a, loop_b = f.practice
+            loop = f"  LOOP {loop_a or 0}-{loop_b}" if loop_b is not None else (f"  A {loop_a}" if loop_a is not None else "")
+            px_text(top, f"PRACTICE {round(rate*100)}%{loop}", 12, PX_H-30)
+            px_text(top, "Left/Right seek  -/= speed  A/B/C loop  E done", 12, PX_H-16, size=10)
+        elif state=="edit":
+            px_text(top, f"EDIT beat {f.edit[0]:g}  Space add/del  E done", 12, PX_H-18)
+        elif state=="fail":
+            px_text_center(top, "FAILED", PX_W//2, PX_H//2-16)
+            px_text_center(top, "Space/Delete/Enter retry", PX_W//2, PX_H//2+2)
+            # draw retry button
+            btn_box(top, r_retry)
+            px_text(top, "RETRY", r_retry.x+8, r_retry.y+1, color=(10,10,10))
+        elif state=="pass":
+            # non-final levels: show home/next with labels; final level shows trophy
+            # show star rating
+            stars = f.stars
+            sx = PX_W//2 - 18
+            sy = PX_H//2 + 28
+            for i in range(3):
+                col = (255,215,0) if i < stars else (180,180,180)
+                px_rect(top, sx + i*12, sy, 8, 8, col)
+            if level_idx == len(LEVELS)-1:
+                # final clear: larger green message + multi-pixel trophy sprite
+                px_text_center(top, "恭喜你通关！", PX_W//2, PX_H//2-30, color=(46,204,113), size=14, outline=True)
+                # English fallback visible for systems without CJK fonts
+                px_text_center(top, "VICTORY", PX_W//2, PX_H//2-10, color=(46,204,113), size=14, outline=True)
+                tx, ty = PX_W//2, PX_H//2+6
+                # trophy cup (top)
+                px_rect(top, tx-3, ty-6, 6, 4, (255,215,0))
+                px_rect(top, tx-2, ty-8, 4, 2, (255,215,0))
+                # handles
+                px_rect(top, tx-5, ty-4, 2, 2, (200,160,0))
+                px_rect(top, tx+3, ty-4, 2, 2, (200,160,0))
+                # stem/base
+                px_rect(top, tx-1, ty-2, 2, 3, (200,160,0))
+                px_rect(top, tx-3, ty+2, 6, 2, (150,120,0))
+            else:
+                # show congrats text (use Chinese for level 1, English otherwise)
+                if level_idx == 0:
+                    px_text_center(top, "恭喜你完成！", PX_W//2, PX_H//2-22, color=(46,204,113), outline=True)
+                    px_text_center(top, "CLEARED", PX_W//2, PX_H//2-10, color=(46,204,113), size=14, outline=True)
+                else:
+                    px_text_center(top, "CLEARED", PX_W//2, PX_H//2-22, color=(46,204,113), size=14, outline=True)
+                # always draw home/next buttons for non-final levels
+                btn_home(top, r_pass_home)
+                # English label under home for visibility
+                px_text(top, "BACK", r_pass_home.x + 6, r_pass_home.y + r_pass_home.h + 1, color=(10,10,10), size=12, outline=True)
+                btn_next(top, r_pass_next, active=(level_idx < len(LEVELS)-1))
+                px_text(top, "NEXT", r_pass_next.x + 8, r_pass_next.y + r_pass_next.h + 1, color=(10,10,10), size=12, outline=True)
+            # end of pass overlays
+
+        if f.show_timing:
+            st = pacer.stats()
+            px_text(top, f"{st['mean_ms']:.1f}ms sd{st['stdev_ms']:.2f} p99 {st['p99_ms']:.1f}{' SHED' if pacer.shed else ''}", 4, PX_H-12, size=10)
+
+        if palette:
+            # the flash entry only colours a low HP column; otherwise it needs no swap
+            return palette.effects(night=f.night, fade=f.fade, grey=f.grey, flash=f.flash and f.hp <= 2)
+        return None
+
+    def show(px, fx):
+        """Present a drawn canvas (on the main thread, as SDL wants) and record it."""
+        nonlocal frames_saved
+        presenter.present(px, fx)
+
+        # save frame if recording
+        if record_mode and frames_dir is not None:
+            try:
+                save_frame(px, frames_dir, frames_saved)
+                frames_saved += 1
+            except Exception as e:
+                print('frame save error', e)
+
+    if render_thread:
+        renderer = RenderThread(draw_frame, [px] + [presenter.make_canvas() for _ in range(2)], pacer)
 
-        for e in pygame.event.get():
-            if e.type == pygame.QUIT: pygame.quit(); sys.exit(0)
+    while True:
+        dt = sim_pacer.tick()
+
+        events = pygame.event.get()
+        if pilot:
+            events += pilot.events(state, unlocked)
+            if pilot.cycle != soak_cycle:
+                soak_cycle = pilot.cycle
+                soak.sample(soak_cycle)
+                if pilot.done(): quit_game()
+        auto_play = record_mode or (pilot is not None and pilot.auto_play)
+
+        for e in events:
+            if e.type == pygame.QUIT: quit_game()
             if e.type == pygame.KEYDOWN:
-                if e.key in (pygame.K_ESCAPE, pygame.K_q): pygame.quit(); sys.exit(0)
-                if e.key == pygame.K_m:
-                    GAME_CFG.muted = not GAME_CFG.muted
-                    if GAME_CFG.muted: bg_ch.stop()
-                    else: play_bg(lvl["bpm"])
+                if e.key in (pygame.K_ESCAPE, pygame.K_q): quit_game()
+                if e.key == pygame.K_F3: show_timing = not show_timing
+                if e.key == pygame.K_m: toggle_music()
+                if e.key == pygame.K_n and palette:
+                    GAME_CFG.theme = "day" if GAME_CFG.theme == "night" else "night"
                 if e.key == pygame.K_RETURN:
                     # Enter/Return also retries when failing
                     if state == "fail":
@@ -467,24 +2997,45 @@ def main():
                         elif state=="fail": start_level(level_idx); state="playing"
                         elif state=="pass": state="select"
 
-                if state=="playing":
+                if state in ("playing", "practice"):
                     if e.key in (pygame.K_w, pygame.K_UP): duck.up()
                     if e.key in (pygame.K_s, pygame.K_DOWN): duck.down()
+                if state=="practice":
+                    if e.key == pygame.K_e: state="select"; stop_bg()
+                    else: practice_key(e.key)
+                elif state=="edit":
+                    # the duck auto-plays the preview; the cursor has its own lane
+                    if e.key in (pygame.K_w, pygame.K_UP): edit_lane = max(0, edit_lane-1)
+                    if e.key in (pygame.K_s, pygame.K_DOWN): edit_lane = min(len(laneYs)-1, edit_lane+1)
+                    if e.key == pygame.K_SPACE:
+                        editor.toggle(editor.cursor(t)[0], edit_lane); edits += 1
+                        notes.rechart(editor.chart(), t)
+                    if e.key == pygame.K_e:
+                        leave_editor(); state="select"
+                elif state=="select" and e.key == pygame.K_e:
+                    start_editor(level_idx); state="edit"
+                elif state=="select" and e.key == pygame.K_p:
+                    start_practice(level_idx); state="practice"
 
             if e.type == pygame.MOUSEBUTTONDOWN:
-                mx,my = pygame.mouse.get_pos(); mx//=SCALE; my//=SCALE
+                mx,my = e.pos; mx//=SCALE; my//=SCALE
                 if r_music.collidepoint(mx,my):
-                    GAME_CFG.muted = not GAME_CFG.muted
-                    if GAME_CFG.muted: bg_ch.stop()
-                    else: play_bg(lvl["bpm"])
+                    toggle_music()
                 elif r_style.collidepoint(mx,my):
                     GAME_CFG.note_style = "cloud" if GAME_CFG.note_style=="sun" else "sun"
                 elif state=="menu" and r_start.collidepoint(mx,my):
                     state="select"
-                elif state=="playing" and r_exit.collidepoint(mx,my):
-                    state="select"; bg_ch.stop()
+                elif state in ("playing", "practice") and r_exit.collidepoint(mx,my):
+                    state="select"; stop_bg()
+                elif state=="edit" and r_exit.collidepoint(mx,my):
+                    leave_editor(); state="select"
                 elif state=="fail" and r_retry.collidepoint(mx,my):
                     start_level(level_idx); state = "playing"
+                elif state=="select":
+                    for i in range(min(unlocked, len(LEVELS))):
+                        if level_rect(i).collidepoint(mx,my):
+                            level_idx=i; start_level(level_idx); state="playing"
+                            break
                 elif state=="pass":
                     # pass-screen buttons: home or next
                     if r_pass_home.collidepoint(mx,my):
@@ -496,202 +3047,102 @@ def main():
                             state = "playing"
 
         # ===== Update =====
-        if state=="playing":
-            t += dt
-
-            # spawn scheduled notes
-            while upcoming and upcoming[0]["spawn"] <= t:
-                info = upcoming.pop(0)
-                notes.append(Note(PX_W+10, info["lane"], laneYs[info["lane"]]))
-
-            for n in notes:
-                n.update(dt)
-
-            # auto-play: if recording, perform perfect hits when notes enter hit window
-            if record_mode:
-                for n in notes:
-                    if not n.hit and not n.missed and abs(n.x - HIT_X) <= HIT_WIN:
-                        # snap duck to lane and register hit
-                        duck.idx = n.lane
-                        duck.y = duck.lanes[duck.idx]
-                        n.hit = True
-                        duck.eat()
-                        if not GAME_CFG.muted:
-                            lane_sounds[min(n.lane,2)].play(); sfx_eat.play()
-                        # scoring for auto-hit: assume perfect (offset ~=0)
-                        label, pts = score_for_hit(0.0)
-                        score += pts
-                        last_hit_label = label
-
-            # player input hit detection
-            for n in notes:
-                if not n.hit and not n.missed and n.lane==duck.idx and abs(n.x-HIT_X)<=HIT_WIN:
-                    n.hit=True; duck.eat()
-                    # compute timing offset based on x distance
-                    offset = (n.x - HIT_X) / NOTE_SPD
-                    label, pts = score_for_hit(offset)
+        if bg_stream: bg_stream.pump()
+        if state in ("playing", "practice"):
+            # practice runs the song clock slower; chart times stay as compiled
+            t += (dt * practice_rate) if state=="practice" else dt
+            if state=="practice" and loop_b is not None and t >= practice_tmap.time_at(loop_b):
+                practice_seek(loop_a or 0)
+
+            # spawn notes that scrolled in, then place all of them for song time t
+            notes.spawn_due(t)
+            notes.update(t)
+
+            # auto-play: if recording (or soak retry), perform perfect hits when notes enter hit window
+            if auto_play:
+                for n in hit_pass(notes, duck, t, auto=True):
+                    if not GAME_CFG.muted:
+                        lane_sounds[n.lane].play(); sfx_eat.play()
+                    # scoring for auto-hit: assume perfect (offset ~=0)
+                    label, pts = score_for_hit(0.0)
                     score += pts
+                    judgements[label] += 1
                     last_hit_label = label
-                    if not GAME_CFG.muted:
-                        lane_sounds[min(n.lane,2)].play(); sfx_eat.play()
 
-            # process misses
-            for n in notes:
-                if n.missed:
-                    miss_count += 1
-                    # each miss reduces HP segments by 2
-                    score = max(0, score-50)
-                    n.missed=False
-
-            notes = [n for n in notes if n.x>-8 and not (n.hit and n.x<HIT_X-10)]
+            # player input hit detection
+            for n in hit_pass(notes, duck, t):
+                offset = n.hit_time - t
+                label, pts = score_for_hit(offset)
+                score += pts
+                judgements[label] += 1
+                last_hit_label = label
+                if not GAME_CFG.muted:
+                    lane_sounds[n.lane].play(); sfx_eat.play()
+
+            # hold notes: points for every tick sustained in the lane
+            score += hold_pass(notes, duck, t) * HOLD_TICK_POINTS
+
+            # process misses: each miss reduces HP segments by 2
+            missed = miss_pass(notes, t)
+            if missed:
+                miss_count += missed
+                grey_t = MISS_GREY_T
+                score = max(0, score-50*missed)
+
+            notes.cull()
             duck.update(dt)
 
+            # practice never fails; it starts over at the loop start (or the top)
+            if state=="practice":
+                if not notes.pending(): practice_seek(loop_a or 0)
             # fail if too many misses or HP depleted
-            if miss_count >= MAX_MISSES or (HP_SEGMENTS - miss_count*2) <= 0:
-                state="fail"; bg_ch.stop()
-            elif not upcoming and not notes:
-                state="pass"; bg_ch.stop()
+            elif miss_count >= MAX_MISSES or (HP_SEGMENTS - miss_count*2) <= 0:
+                state="fail"; stop_bg()
+                store.record(lvl["name"], False, score, 0, miss_count, judgements)
+            elif not notes.pending():
+                state="pass"; stop_bg()
                 unlocked = max(unlocked, min(level_idx+2, len(LEVELS)))
+                prefetch.want(level_idx+1)   # ready by the time NEXT is clicked
                 # determine stars for this level based on miss_count
-                def stars_for_misses(m):
-                    if m == 0: return 3
-                    if m in (1,2): return 2
-                    if m == 3: return 1
-                    return 0
                 level_stars = stars_for_misses(miss_count)
-                # update best score
-                if score > best_score:
-                    best_score = score
-                    save_best_score(best_score)
-
-        # ===== Draw to pixel canvas =====
-        draw_bg(px, laneYs)
-
-        # top-left minimal info (crisp)
-        px_text(px, f"Lv{level_idx+1} BPM{lvl['bpm']} L{lvl['lanes']}", 6, 4)
-        # score display
-        px_text(px, f"SCORE: {score}", 6, 16)
-        if last_hit_label:
-            px_text(px, f"{last_hit_label}", PX_W-60, 6, color=(255,215,0))
-
-        # buttons
-        btn_style_toggle(px, r_style)
-        btn_speaker(px, r_music, muted=GAME_CFG.muted)
-        if state=="playing":
-            btn_eject(px, r_exit)
-
-        # notes & duck
-        for n in notes: n.draw(px)
-        duck.draw(px)
-
-        # HP 10 segments right side, flash if <=2
-        remain = max(0, HP_SEGMENTS - miss_count*2)
-        flash_t += dt
-        bottom_margin_px = 6
-        grid_x, grid_y = PX_W-12, PX_H-58 - bottom_margin_px
-        seg_h, gap = 4, 2
-        for i in range(HP_SEGMENTS):
-            y = grid_y + (HP_SEGMENTS-1-i)*(seg_h+gap)
-            px_rect(px, grid_x-1, y-1, 6, seg_h+2, (210,210,210))
-            if i < remain:
-                if remain <= 2 and int(flash_t*6)%2==0:
-                    col = (255,80,80)
-                else:
-                    col = (46,204,113) if remain>5 else (243,156,18) if remain>2 else (231,76,60)
-            else:
-                col = (180,180,180)
-            px_rect(px, grid_x, y, 4, seg_h, col)
-
-        # overlays
-        if state=="menu":
-            px_text_center(px, "RHYTHM DUCK // PIXEL", PX_W//2, PX_H//2-28)
-            btn_play(px, r_start)
-            px_text(px, "W/S or Up/Down  •  Space/Delete  •  M toggle", 12, PX_H-18)
+                # queued for the writer thread; no disk access here
+                store.record(lvl["name"], True, score, level_stars, miss_count, judgements)
+        elif state=="edit":
+            t += dt
+            if t >= editor.loop_time():
+                # the preview loops: start the song and the chart over
+                t = 0.0
+                notes.clear()
+                notes = NoteField(laneYs, editor.chart())
+                play_bg(bg_track)
+            notes.spawn_due(t)
+            notes.update(t)
+            for n in hit_pass(notes, duck, t, auto=True):
+                if not GAME_CFG.muted:
+                    lane_sounds[n.lane].play(); sfx_eat.play()
+            hold_pass(notes, duck, t)
+            miss_pass(notes, t)
+            notes.cull()
+            duck.update(dt)
         elif state=="select":
-            px_text_center(px, "SELECT LEVEL", PX_W//2, 18)
             mx,my = pygame.mouse.get_pos(); mx//=SCALE; my//=SCALE
-            for i,_ in enumerate(LEVELS):
-                r = pygame.Rect(30 + i*70, 48, 60, 20)
-                hovered = r.collidepoint(mx,my)
-                # highlight on hover
-                if hovered:
-                    btn_box(px, r, active=True)
-                else:
-                    btn_box(px, r, active=(i<unlocked))
-                px_text(px, f"{i+1}", r.x+26, r.y+6)
-                if i<unlocked and pygame.mouse.get_pressed()[0] and hovered:
-                    level_idx=i; start_level(level_idx); state="playing"
-            px_text(px, "Space/Delete to play", PX_W//2-40, PX_H-18)
-        elif state=="fail":
-            px_text_center(px, "FAILED", PX_W//2, PX_H//2-16)
-            px_text_center(px, "Space/Delete/Enter retry", PX_W//2, PX_H//2+2)
-            # draw retry button
-            btn_box(px, r_retry)
-            px_text(px, "RETRY", r_retry.x+8, r_retry.y+1, color=(10,10,10))
-        elif state=="pass":
-            # non-final levels: show home/next with labels; final level shows trophy
-            # show star rating
-            try:
-                stars = level_stars
-            except NameError:
-                stars = 0
-            sx = PX_W//2 - 18
-            sy = PX_H//2 + 28
-            for i in range(3):
-                col = (255,215,0) if i < stars else (180,180,180)
-                px_rect(px, sx + i*12, sy, 8, 8, col)
-            if level_idx == len(LEVELS)-1:
-                # final clear: larger green message + multi-pixel trophy sprite
-                px_text_center(px, "恭喜你通关！", PX_W//2, PX_H//2-30, color=(46,204,113), size=14, outline=True)
-                # English fallback visible for systems without CJK fonts
-                px_text_center(px, "VICTORY", PX_W//2, PX_H//2-10, color=(46,204,113), size=14, outline=True)
-                tx, ty = PX_W//2, PX_H//2+6
-                # trophy cup (top)
-                px_rect(px, tx-3, ty-6, 6, 4, (255,215,0))
-                px_rect(px, tx-2, ty-8, 4, 2, (255,215,0))
-                # handles
-                px_rect(px, tx-5, ty-4, 2, 2, (200,160,0))
-                px_rect(px, tx+3, ty-4, 2, 2, (200,160,0))
-                # stem/base
-                px_rect(px, tx-1, ty-2, 2, 3, (200,160,0))
-                px_rect(px, tx-3, ty+2, 6, 2, (150,120,0))
-            else:
-                # show congrats text (use Chinese for level 1, English otherwise)
-                if level_idx == 0:
-                    px_text_center(px, "恭喜你完成！", PX_W//2, PX_H//2-22, color=(46,204,113), outline=True)
-                    px_text_center(px, "CLEARED", PX_W//2, PX_H//2-10, color=(46,204,113), size=14, outline=True)
-                else:
-                    px_text_center(px, "CLEARED", PX_W//2, PX_H//2-22, color=(46,204,113), size=14, outline=True)
-                # always draw home/next buttons for non-final levels
-                btn_home(px, r_pass_home)
-                # English label under home for visibility
-                px_text(px, "BACK", r_pass_home.x + 6, r_pass_home.y + r_pass_home.h + 1, color=(10,10,10), size=12, outline=True)
-                btn_next(px, r_pass_next, active=(level_idx < len(LEVELS)-1))
-                px_text(px, "NEXT", r_pass_next.x + 8, r_pass_next.y + r_pass_next.h + 1, color=(10,10,10), size=12, outline=True)
-            # end of pass overlays
-
-        # blit scaled (nearest)
-        screen.blit(pygame.transform.scale(px, (SCREEN_W, SCREEN_H)), (0,0))
-        pygame.display.flip()
-
-        # save frame if recording
-        if record_mode and frames_dir is not None:
-            try:
-                # save as PNG frames
-                count = len([n for n in os.listdir(frames_dir) if n.endswith('.png')])
-                fname = os.path.join(frames_dir, f'frame_{count:05d}.png')
-                pygame.image.save(screen, fname)
-            except Exception as e:
-                print('frame save error', e)
+            hover = next((i for i in range(len(LEVELS)) if level_rect(i).collidepoint(mx,my)), None)
+            if hover is not None and hover < unlocked: prefetch.want(hover)
+
+        # ===== Hand the frame to the renderer =====
+        frame = snapshot(dt)
+        if renderer:
+            renderer.check(); renderer.publish(frame)
+            drawn = renderer.ready()
+            if drawn: show(*drawn)
+        else:
+            show(px, draw_frame(frame, px))
 
         # after level end, if recording was enabled, auto-mux frames into mp4 (requires ffmpeg installed)
         try:
                 if record_mode and frames_dir is not None and not frames_muxed and state in ("pass","fail","menu"):
                     # wait until frame files stop growing for a short stable period
-                    try:
-                        count = len([n for n in os.listdir(frames_dir) if n.endswith('.png')])
-                    except Exception:
-                        count = 0
+                    count = frames_saved
                     now = time.time()
                     if count == frames_last_count:
                         if frames_last_stable_since is None:
@@ -704,8 +3155,7 @@ def main():
                                 ffexe = _ff.get_ffmpeg_exe()
                             except Exception:
                                 ffexe = 'ffmpeg'
-                            cmd = [ffexe, '-y', '-framerate', '60', '-i', os.path.join(frames_dir, 'frame_%05d.png'), '-c:v', 'libx264', '-pix_fmt', 'yuv420p', out_mp4]
-                            subprocess.run(cmd)
+                            subprocess.run(mux_command(ffexe, frames_dir, out_mp4))
                             frames_muxed = True
                     else:
                         frames_last_count = count
@@ -714,5 +3164,4 @@ def main():
             print('auto-mux error', e)
 
 if __name__ == "__main__":
-    pygame.mixer.pre_init(SR, size=16, channels=2, buffer=1024)
     main()
@@ -0,0 +1,45 @@
+"""Entity-layer micro-benchmarks: per-note memory and spawn/cull churn."""
+import tracemalloc
+from harness import case
+
+class DictNote:
+    # the pre-__slots__ layout of Note, kept here as the comparison point
+    def __init__(self, x, lane, y):
+        self.x=x; self.lane=lane; self.y=y
+        self.hit=False; self.missed=False
+
+def bytes_per_object(factory, count=10000):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [factory(i) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # subtract the list that holds them
+    return round((after - before - objs.__sizeof__()) / count, 1)
+
+@case("note_memory")
+def bench_note_memory(game):
+    def make():
+        return [game.Note(i, i % 3, 60) for i in range(1000)]
+    make.metrics = dict(
+        slots_bytes_per_note=bytes_per_object(lambda i: game.Note(i, i % 3, 60)),
+        dict_bytes_per_note=bytes_per_object(lambda i: DictNote(float(i), i % 3, 60)),
+    )
+    return make
+
+@case("spawn_cull", notes=[1000, 10000])
+def bench_spawn_cull(game, notes):
+    # a whole chart's worth of notes spawning, scrolling off and being culled
+    laneYs = game.lane_ys_for(3)
+    schedule = [dict(spawn=i*0.02, lane=i % 3, hit=i*0.02 + game.TRAVEL_TIME) for i in range(notes)]
+    chart = game.compile_chart(schedule, game.ScrollMap())
+    dt = 1/60
+    def churn():
+        field = game.NoteField(laneYs, chart)
+        t = 0.0
+        while field.pending():
+            t += dt
+            field.spawn_due(t)
+            field.update(t)
+            field.cull()
+    return churn
@@ -0,0 +1,214 @@
+"""Benchmarks for the per-frame and per-level hot paths of the final game."""
+import os, random, tempfile, tracemalloc
+from harness import case
+
+def synthetic_level(n, lanes=3, bpm=100, seed=0):
+    # gaps of 1-2 beats keep the chart playable under MIN_TIME_GAP; denser
+    # charts make build_schedule push every later note back one tick at a time
+    rnd = random.Random(seed)
+    pattern, beat = [], 0.0
+    for _ in range(n):
+        pattern.append((beat, rnd.randrange(lanes)))
+        beat += rnd.choice((1, 1, 1.5, 2))
+    return dict(name=f"synthetic{n}", bpm=bpm, lanes=lanes, pattern=pattern)
+
+def screen_full_of_notes(game, count, lanes=3):
+    """Notes spread evenly across the playfield, as if mid-level."""
+    laneYs = game.lane_ys_for(lanes)
+    duck = game.Duck(laneYs)
+    span = game.PX_W + 18
+    schedule = [dict(lane=i % lanes, hit=(-8 + span*i/count - game.HIT_X) / game.NOTE_SPD) for i in range(count)]
+    field = game.NoteField(laneYs, game.compile_chart(schedule, game.ScrollMap()))
+    field.spawn_due(0.0)
+    return field, duck
+
+@case("build_schedule", n=[100, 1000, 10000, 100000])
+def bench_build_schedule(game, n):
+    level = synthetic_level(n)
+    return lambda: game.build_schedule(level)
+
+@case("live_edit", notes=[500, 5000])
+def bench_live_edit(game, notes):
+    # one chart-editor edit mid-song: toggle the note under the cursor and patch
+    # the live field; toggling twice per call leaves the chart as it was
+    live = game.LiveSchedule(synthetic_level(notes))
+    field = game.NoteField(game.lane_ys_for(3), live.chart())
+    now = float(live.hit[notes // 2])
+    field.spawn_due(now); field.update(now); field.cull()
+    beat, _ = live.cursor(now)
+    def edit():
+        for _ in range(2):
+            live.toggle(beat, 1)
+            field.rechart(live.chart(), now)
+    return edit
+
+@case("field_seek", notes=[1000, 100000])
+def bench_field_seek(game, notes):
+    # practice-mode jump to the middle of the chart
+    chart = game.chart_for_level(synthetic_level(notes))
+    field = game.NoteField(game.lane_ys_for(3), chart)
+    now = float(chart.hit[notes // 2])
+    return lambda: field.seek(now)
+
+@case("analyze_charts", charts=[1, 1000])
+def bench_analyze_charts(game, charts):
+    schedules = [game.build_schedule(synthetic_level(100, seed=k)) for k in range(charts)]
+    run = lambda: game.analyze_charts(schedules)
+    run.metrics = dict(charts=charts, notes_per_chart=100)
+    return run
+
+@case("note_frame_passes", notes=[10, 100, 1000])
+def bench_note_passes(game, notes):
+    # one frame of update + auto/player hit + miss + cull at song time 0,
+    # restored before each call
+    field, duck = screen_full_of_notes(game, notes)
+    saved = [list(q) for q in field.active]
+    def frame():
+        for lane, q in enumerate(field.active):
+            q.clear()
+            for n in saved[lane]:
+                n.hit = False; n.missed = False
+                q.append(n)
+        field.judge = [0]*len(field.active)
+        field.gone[:] = False; field.lo = 0
+        field.update(0.0)
+        game.hit_pass(field, duck, 0.0, auto=True)
+        game.hit_pass(field, duck, 0.0)
+        game.miss_pass(field, 0.0)
+        field.cull()
+    return frame
+
+@case("px_text")
+def bench_px_text(game):
+    px = game.pygame.Surface((game.PX_W, game.PX_H)).convert()
+    return lambda: game.px_text(px, "SCORE: 12345", 6, 16)
+
+@case("draw_bg", lanes=[2, 4])
+def bench_draw_bg(game, lanes):
+    px = game.pygame.Surface((game.PX_W, game.PX_H)).convert()
+    laneYs = game.lane_ys_for(lanes)
+    return lambda: game.draw_bg(px, laneYs)
+
+@case("upscale_frame")
+def bench_upscale(game):
+    screen = game.pygame.display.get_surface()
+    px = game.pygame.Surface((game.PX_W, game.PX_H)).convert()
+    return lambda: game.upscale_to(screen, px)
+
+@case("hud_frame", changed=["none", "score", "all"])
+def bench_hud(game, changed):
+    # one frame of HUD: unchanged inputs cost one layer blit
+    pg = game.pygame
+    px = pg.Surface((game.PX_W, game.PX_H)).convert()
+    r = pg.Rect(game.PX_W-18, 4, 14, 12)
+    hud = game.game_hud(pg.Surface((game.PX_W, game.PX_H), pg.SRCALPHA), r.move(-18, 0), r, r.move(0, 130))
+    keys = {"info": (0, 92, 2), "score": 0, "label": "PERFECT", "style": "sun",
+            "music": False, "eject": True, "hp": (8,)}
+    n = iter(range(1, 10**9))
+    def frame():
+        i = next(n)
+        if changed == "score":
+            keys["score"] = i
+        elif changed == "all":
+            keys.update(info=(i, 92, 2), score=i, label=("OK", "GOOD")[i % 2], hp=(2, (i % 2,)*3))
+        hud.update(dict(keys))
+        hud.draw(px)
+    return frame
+
+@case("square_sound")
+def bench_square_sound(game):
+    return lambda: game.square_sound(392.0, 0.24, game.VOL)
+
+@case("osc_chord", voices=[1, 4, 8])
+def bench_osc_chord(game, voices):
+    # one second of a chord rendered into a reused buffer
+    buf = game.np.zeros(game.SR, game.np.float32)
+    freqs = [game.midi_to_hz(48 + 4*i) for i in range(voices)]
+    def render():
+        buf[:] = 0
+        for f in freqs:
+            game.OSC.voice("square", f, buf, 0.8/voices)
+    return render
+
+@case("bg_song_twinkle", bpm=[92, 122])
+def bench_bg_song(game, bpm):
+    build = lambda: game.bg_song_twinkle(bpm)
+    snd = build()   # warm-up, outside the traced peak
+    tracemalloc.start(); build(); peak = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    # peak traced memory while building, the finished Sound's own buffer included
+    build.metrics = dict(peak_bytes=peak, seconds=round(snd.get_length(), 2))
+    return build
+
+@case("record_frame_write", surface=["screen", "canvas", "indexed"])
+def bench_record_frame(game, surface):
+    # what record mode used to write (the upscaled screen) vs the native canvas
+    if surface == "indexed":
+        px = game.SoftwarePresenter(indexed=True).make_canvas()
+    else:
+        px = game.pygame.Surface((game.PX_W, game.PX_H)).convert()
+    game.draw_bg(px, game.lane_ys_for(3))
+    game.px_text(px, "SCORE: 12345", 6, 16)
+    if surface == "screen":
+        src = game.pygame.display.get_surface()
+        game.upscale_to(src, px)
+    else:
+        src = px
+    frames_dir = tempfile.mkdtemp(prefix="rd_bench_frames_")
+    index = iter(range(10**9))
+    def write():
+        game.save_frame(src, frames_dir, next(index))
+    return write
+
+@case("present_frame", backend=["software", "indexed", "renderer"])
+def bench_present(game, backend):
+    # sprites + upload/upscale + flip, as in one frame of play with 30 notes
+    if backend in ("software", "indexed"):
+        p = game.SoftwarePresenter(indexed=backend == "indexed")
+    else:
+        try:
+            p = game.RendererPresenter()
+        except Exception:
+            # headless boxes only have SDL's software renderer; still worth timing
+            p = game.RendererPresenter(accelerated=False)
+    px = p.make_canvas()
+    laneYs = game.lane_ys_for(3)
+    fx = p.palette.effects(flash=True) if p.palette else None
+    def frame():
+        p.begin(px)
+        game.draw_bg(px, laneYs)
+        for i in range(30):
+            p.sprite(px, game.note_sprite_key(i % 5 == 0), 20 + i*7, laneYs[i % 3])
+        p.sprite(px, ("duck", False), game.HIT_X-6, laneYs[1])
+        p.present(px, fx)
+    return frame
+
+@case("start_level_swap", prefetched=[False, True])
+def bench_start_level(game, prefetched):
+    # what start_level costs with a cold build vs an already prefetched bundle
+    tones = lambda n: [game.square_sound(f, 0.24, game.VOL) for f in game.lane_freqs(n)]
+    build = lambda i: game.build_level_bundle(i, tones, game.bg_song_twinkle)
+    ready = build(1) if prefetched else None
+    def start():
+        b = ready if prefetched else build(1)
+        game.NoteField(b.laneYs, b.chart)
+    return start
+
+@case("retry_restore", snapshot=[False, True])
+def bench_retry_restore(game, snapshot):
+    # restarting a streamed level: fresh field and stream start vs the
+    # snapshot's field rewound in place and the stream's kept first chunks
+    import pygame
+    chart = game.chart_for_level(synthetic_level(5000))
+    field = game.NoteField(game.lane_ys_for(3), chart)
+    sr, _, nch = pygame.mixer.get_init()
+    song = game.np.zeros((sr * 60, nch), game.np.int16)
+    stream = game.PcmStream(song, sr, 1.0 / 32768)
+    channel = pygame.mixer.Channel(0)
+    def retry():
+        if snapshot:
+            field.reset()
+        else:
+            game.NoteField(field.ys, chart)
+            stream.intro = None
+        stream.play(channel)
+    return retry
@@ -0,0 +1,76 @@
+"""Check that an old best_score.txt reaches the score store and the menu.
+
+Usage:
+    python benchmarks/check_best_score.py
+
+ScoreStore.import_legacy must keep the file's score in the meta table,
+not as a run, and only on the first start. A headless run of the game in
+a directory holding best_score.txt must then show it on the menu as
+"BEST <score>". Exits 1 on the first mismatch.
+"""
+import os, sys, sqlite3, tempfile
+from harness import load_game
+
+LEGACY = 1234
+
+def check_store(game, tmp):
+    txt, db = os.path.join(tmp, "best_score.txt"), os.path.join(tmp, "store.db")
+    with open(txt, "w") as f: f.write(f"{LEGACY}\n")
+    store = game.ScoreStore(db); store.import_legacy(txt); store.close()
+    with open(txt, "w") as f: f.write("9999\n")     # a second start must not import again
+    store = game.ScoreStore(db); store.import_legacy(txt)
+    assert store.legacy_best == LEGACY, store.legacy_best
+    assert store.best_overall() == LEGACY, store.best_overall()
+    level = game.LEVELS[0]["name"]
+    store.record(level, True, LEGACY - 1, 3, 0, {})
+    assert store.best_overall() == LEGACY, "a lower run hid the imported best"
+    store.record(level, True, LEGACY + 1, 3, 0, {})
+    assert store.best_overall() == LEGACY + 1, "a higher run did not beat the imported best"
+    store.close()
+    con = sqlite3.connect(db)
+    runs = con.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+    levels = [r[0] for r in con.execute("SELECT DISTINCT level FROM runs")]
+    con.close()
+    assert runs == 2 and levels == [level], (runs, levels)
+
+def check_menu(game, tmp, frames=30):
+    """Run main() on the menu for a few frames and collect the text it draws."""
+    with open(os.path.join(tmp, "best_score.txt"), "w") as f: f.write(f"{LEGACY}\n")
+    pg = game.pygame
+    drawn = set()
+    real_text, real_center, real_get = game.px_text, game.px_text_center, pg.event.get
+    def text(s, t, *a, **kw): drawn.add(t); return real_text(s, t, *a, **kw)
+    def center(s, t, *a, **kw): drawn.add(t); return real_center(s, t, *a, **kw)
+    count = [0]
+    def get(*a, **kw):
+        count[0] += 1
+        ev = list(real_get(*a, **kw))
+        if count[0] >= frames: ev.append(pg.event.Event(pg.QUIT))
+        return ev
+    game.px_text, game.px_text_center, pg.event.get = text, center, get
+    argv, cwd = sys.argv, os.getcwd()
+    sys.argv = ["game", "--scores", os.path.join(tmp, "menu.db"), "--pacing=fixed"]
+    os.chdir(tmp)
+    try:
+        game.main()
+    except SystemExit:
+        pass
+    finally:
+        game.px_text, game.px_text_center, pg.event.get = real_text, real_center, real_get
+        sys.argv = argv; os.chdir(cwd)
+    assert f"BEST {LEGACY}" in drawn, sorted(drawn)
+
+def main():
+    game = load_game()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            check_store(game, tmp)
+            check_menu(game, tmp)
+        except AssertionError as e:
+            print("best score check FAILED:", e)
+            return 1
+    print(f"best score check ok: best_score.txt imported once as {LEGACY}, not as a run, and shown on the menu")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
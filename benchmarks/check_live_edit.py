@@ -0,0 +1,106 @@
+"""Randomized equivalence check for the chart editor's incremental path.
+
+Usage:
+    python benchmarks/check_live_edit.py              # 60 levels x 40 edits, 40 recharted plays
+    python benchmarks/check_live_edit.py --seed 7     # another random sequence
+
+After every LiveSchedule edit the live chart must equal what build_schedule
+and chart_for_level make of the edited level from scratch (chords, holds,
+tempo changes and stops included). During auto-played runs with an edit
+every 37 frames, NoteField.rechart must leave exactly the notes a fresh
+spawn would show. Exits 1 on the first mismatch.
+"""
+import sys, random, argparse
+import numpy as np
+from harness import load_game
+from bench_hotpaths import synthetic_level
+
+def chord_groups(chord):
+    """Chord ids as a canonical partition (the two paths number chords differently)."""
+    ids = {}
+    return [-1 if c < 0 else ids.setdefault(int(c), len(ids)) for c in chord]
+
+def check_schedule(game, live, level):
+    ref = game.build_schedule(level)
+    assert len(ref) == len(live), (len(ref), len(live))
+    assert [r["lane"] for r in ref] == live.lane.tolist(), "lanes differ"
+    assert np.array_equal([r["hit"] for r in ref], live.hit), "hit times differ"
+    assert np.array_equal([r.get("end", r["hit"]) for r in ref], live.end), "hold ends differ"
+    assert chord_groups([r["chord"] for r in ref]) == chord_groups(live.chord), "chords differ"
+    fresh, chart = game.chart_for_level(level), live.chart()
+    assert np.array_equal(fresh.appear, chart.appear), "appear times differ"
+    assert np.array_equal(fresh.lane, chart.lane), "compiled lanes differ"
+
+def check_edits(game, rnd, trials=60, edits=40):
+    for trial in range(trials):
+        level = synthetic_level(rnd.randrange(0, 60), lanes=rnd.randrange(2, 5), seed=trial)
+        if trial % 2: level["chords"] = True
+        if trial % 3 == 0:
+            level["pattern"] = [(b, l, {"hold": 1}) if i % 4 == 0 else (b, l)
+                                for i, (b, l) in enumerate(level["pattern"])]
+        if trial % 5 == 0:
+            level["tempo"] = [(8, 150)]; level["stops"] = [(12, 0.4)]
+        live = game.LiveSchedule(level)
+        check_schedule(game, live, level)
+        last = max([p[0] for p in level["pattern"]] + [8])
+        for _ in range(edits):
+            beat, lane = rnd.randrange(0, int(last*2) + 4) * 0.5, rnd.randrange(level["lanes"])
+            if rnd.random() < 0.5 and level["pattern"]:
+                beat, lane = rnd.choice(level["pattern"])[:2]     # remove an existing note
+            live.toggle(beat, lane)
+            check_schedule(game, live, level)
+    return trials * edits
+
+def check_field(field, now):
+    """The field shows exactly the chart's spawned, unculled notes, in order."""
+    c = field.chart
+    shown = {(n.hit_time, n.lane) for n in field}
+    assert len(shown) == len(field), "a note is on screen twice"
+    for n in field:
+        assert c.hit[n.idx] == n.hit_time and c.lane[n.idx] == n.lane, "note out of step with chart"
+    for lane, q in enumerate(field.active):
+        hits = [n.hit_time for n in q]
+        assert hits == sorted(hits), "lane queue out of order"
+        assert all(n.hit or n.missed for n in list(q)[:field.judge[lane]]), "judged notes not settled"
+    stop = int(np.searchsorted(c.appear, now, side='right'))
+    due = {(float(c.hit[i]), int(c.lane[i])) for i in range(field.lo, stop) if not field.gone[i]}
+    assert shown == due, (len(shown), len(due))
+
+def check_rechart(game, rnd, trials=40, frames=3000):
+    ys = game.lane_ys_for(3)
+    for trial in range(trials):
+        level = synthetic_level(200, lanes=3, seed=100 + trial)
+        if trial % 2: level["chords"] = True
+        if trial % 3 == 0: level["speed"] = [(20, 1.5), (40, 0.7)]
+        live = game.LiveSchedule(level)
+        field = game.NoteField(ys, live.chart()); duck = game.Duck(ys)
+        t = 0.0
+        for frame in range(frames):
+            t += 1/60
+            field.spawn_due(t); field.update(t)
+            game.hit_pass(field, duck, t, auto=True); game.hold_pass(field, duck, t)
+            game.miss_pass(field, t); field.cull()
+            if frame % 37 == 0:
+                live.toggle(live.cursor(t)[0], rnd.randrange(3))
+                field.rechart(live.chart(), t)
+                field.spawn_due(t); field.update(t)
+                check_field(field, t)
+    return trials
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+    game = load_game()
+    rnd = random.Random(args.seed)
+    try:
+        edits = check_edits(game, rnd)
+        plays = check_rechart(game, rnd)
+    except AssertionError as e:
+        print("live edit check FAILED:", e)
+        return 1
+    print(f"live edit check ok: {edits} edits match build_schedule, {plays} recharted plays match a fresh spawn")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
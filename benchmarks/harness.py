@@ -0,0 +1,64 @@
+"""Shared pieces for the benchmark suite: case registry, game loader, timer.
+
+Cases live in benchmarks/bench_*.py and register themselves with @case.
+Each case function receives the loaded game module (plus its parameters)
+and returns a zero-argument callable; only that callable is timed.
+A case may set a `metrics` dict on the callable for non-timing figures.
+"""
+import os, sys, time, importlib.util
+
+# must be set before pygame is imported anywhere
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, ".."))
+GAME_FILE = os.path.join(ROOT, "111rhythm_duck_final.py")
+
+CASES = []
+
+def case(name, **params):
+    """Register a benchmark. Each keyword takes a list of values to sweep."""
+    def deco(fn):
+        keys = list(params)
+        combos = [{}]
+        for k in keys:
+            combos = [dict(c, **{k: v}) for c in combos for v in params[k]]
+        for p in combos:
+            label = name + "".join(f"[{k}={v}]" for k, v in p.items())
+            CASES.append((label, fn, p))
+        return fn
+    return deco
+
+_game = None
+def load_game():
+    """Import the game file as a module (its name is not a valid identifier)."""
+    global _game
+    if _game is None:
+        spec = importlib.util.spec_from_file_location("rhythm_duck_final", GAME_FILE)
+        _game = importlib.util.module_from_spec(spec)
+        sys.modules["rhythm_duck_final"] = _game
+        spec.loader.exec_module(_game)
+        pg = _game.pygame
+        # the game's own mixer format, so audio cases measure what it plays
+        pg.mixer.pre_init(_game.SR, size=-16, channels=_game.mixer_channels(_game.LEVELS), buffer=1024)
+        pg.init(); pg.font.init()
+        pg.display.set_mode((_game.SCREEN_W, _game.SCREEN_H))
+    return _game
+
+def time_callable(fn, min_time=0.05, repeat=5):
+    """Return per-call timings (seconds) for `repeat` batches of auto-sized loops."""
+    fn()  # warm-up: font lookups, first-touch allocations
+    t0 = time.perf_counter(); fn(); first = time.perf_counter() - t0
+    number = max(1, int(min_time / first)) if first > 0 else 1000
+    if first > 1.0:
+        repeat = min(repeat, 3)
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - t0) / number)
+    return runs, number
+
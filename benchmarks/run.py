@@ -0,0 +1,82 @@
+"""Headless benchmark runner for Rhythm Duck.
+
+Usage:
+    python benchmarks/run.py                      # run everything, save JSON
+    python benchmarks/run.py -k schedule          # only cases whose name matches
+    python benchmarks/run.py --compare old.json   # flag regressions vs a saved run
+"""
+import os, sys, json, time, glob, platform, statistics, argparse, importlib.util
+from harness import HERE, CASES, load_game, time_callable
+
+RESULTS_DIR = os.path.join(HERE, "results")
+
+def run(pattern=None, repeat=5):
+    game = load_game()
+    for path in sorted(glob.glob(os.path.join(HERE, "bench_*.py"))):
+        modname = "benchmarks_" + os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(modname, path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+    results = {}
+    for label, fn, params in CASES:
+        if pattern and pattern not in label:
+            continue
+        target = fn(game, **params)
+        runs, number = time_callable(target, repeat=repeat)
+        results[label] = dict(
+            min=min(runs), median=statistics.median(runs), mean=statistics.fmean(runs),
+            stdev=statistics.pstdev(runs), loops=number, repeat=len(runs),
+        )
+        print(f"{label:<48} {results[label]['median']*1e6:>12.1f} us  (min {min(runs)*1e6:.1f}, x{number})")
+        # cases may attach non-timing figures (bytes per object, ...) to the callable
+        metrics = getattr(target, "metrics", None)
+        if metrics:
+            results[label]["metrics"] = metrics
+            print(" " * 8 + ", ".join(f"{k}={v}" for k, v in metrics.items()))
+    return results
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        base = json.load(f)["results"]
+    regressions = 0
+    print(f"\n--- vs {baseline_path} (regression if > {threshold:.0%} slower) ---")
+    for label, r in results.items():
+        if label not in base:
+            continue
+        ratio = r["median"] / base[label]["median"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"; regressions += 1
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{label:<48} x{ratio:6.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-k", dest="pattern", help="substring filter on case names")
+    ap.add_argument("-o", "--out", help="JSON output path (default: benchmarks/results/<timestamp>.json)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression")
+    args = ap.parse_args(argv)
+
+    results = run(args.pattern, args.repeat)
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d_%H%M%S") + ".json")
+    game = load_game()
+    meta = dict(
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+        platform=platform.platform(), pygame=game.pygame.version.ver, numpy=game.np.__version__,
+    )
+    with open(out, "w") as f:
+        json.dump(dict(meta=meta, results=results), f, indent=2)
+    print("saved", out)
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Rhythm Duck launcher: pick a game variant by name and run it.
+
+Usage:
+    python demo/launcher.py                          # the final game
+    python demo/launcher.py pixel                    # another variant by name
+    python demo/launcher.py final --record           # game flags are passed through
+    python demo/launcher.py --list                   # registered variants
+    python demo/launcher.py pixel --import-times     # report import cost per module
+
+Variants are imported as real modules, so Python reuses the cached bytecode
+in __pycache__ instead of recompiling the source on every launch, and each
+module's top-level setup runs once in its own namespace. Nothing imports
+pygame until a variant is chosen; the variant's main() initialises it.
+"""
+import os, sys, time, importlib, importlib.util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.abspath(os.path.join(HERE, ".."))
+
+# name -> (module, description); main() of the module starts the game
+VARIANTS = {
+    "final":   ("111rhythm_duck_final", "pixel game with recording, charts and soak mode"),
+    "pixel":   ("rhythm_duck_pixel_v3", "pixel demo (v3), what demo/rhd_pixel_demo.py starts"),
+    "pixel-1": ("rhythm_duck_pixel", "first pixel version"),
+    "working": ("111rhythm_duck", "earlier working copy of the final game"),
+    "classic": ("rhythm_duck", "original smooth-graphics version"),
+}
+DEFAULT = "final"
+
+# heavy third-party modules the variants import at the top; timed separately
+DEPENDENCIES = ("numpy", "pygame")
+
+def register(name, module, about=""):
+    """Add a variant; `module` must be importable from the repo root and define main()."""
+    VARIANTS[name] = (module, about)
+
+def bytecode_cached(module):
+    """True when an up-to-date .pyc exists for a top-level module in the repo root."""
+    src = os.path.join(ROOT, module + ".py")
+    try:
+        pyc = importlib.util.cache_from_source(src)
+        return os.path.getmtime(pyc) >= os.path.getmtime(src)
+    except (OSError, NotImplementedError):
+        return False
+
+def timed_import(name):
+    """Import `name`, returning (module, seconds, fresh); fresh is False if it was already loaded."""
+    fresh = name not in sys.modules
+    t0 = time.perf_counter()
+    mod = importlib.import_module(name)
+    return mod, time.perf_counter() - t0, fresh
+
+def load(name):
+    """
+    Import a registered variant. Returns (module, timings), timings being
+    (module name, seconds, note) rows in import order. Dependencies are
+    imported first so the variant's own row is just its top-level setup.
+    """
+    if name not in VARIANTS:
+        raise KeyError(f"unknown variant {name!r}; known: {', '.join(VARIANTS)}")
+    module = VARIANTS[name][0]
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    timings = []
+    for dep in DEPENDENCIES:
+        _, sec, fresh = timed_import(dep)
+        timings.append((dep, sec, "" if fresh else "already loaded"))
+    cached = bytecode_cached(module)
+    mod, sec, fresh = timed_import(module)
+    timings.append((module, sec, "cached .pyc" if cached else "compiled"))
+    return mod, timings
+
+def print_timings(timings):
+    total = sum(sec for _, sec, _ in timings)
+    print("[launcher] import times")
+    for module, sec, note in timings:
+        print(f"[launcher]   {module:<24} {sec*1e3:8.1f} ms  {note}")
+    print(f"[launcher]   {'total':<24} {total*1e3:8.1f} ms")
+
+def launch(name, argv=(), import_times=False):
+    """Import variant `name` and run its main() with `argv` as the game's flags."""
+    mod, timings = load(name)
+    if import_times:
+        print_timings(timings)
+    # the games read their flags from sys.argv
+    sys.argv = [mod.__file__, *argv]
+    return mod.main()
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if "--list" in argv:
+        for name, (module, about) in VARIANTS.items():
+            mark = "*" if name == DEFAULT else " "
+            print(f"{mark} {name:<10} {module + '.py':<28} {about}")
+        return 0
+    import_times = "--import-times" in argv
+    if import_times:
+        argv.remove("--import-times")
+    name = DEFAULT
+    if argv and not argv[0].startswith("-"):
+        name = argv.pop(0)
+    if name not in VARIANTS:
+        print(f"[launcher] unknown variant {name!r}; known: {', '.join(VARIANTS)}", file=sys.stderr)
+        return 2
+    launch(name, argv, import_times)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -91,6 +91,7 @@ def draw_hp(surf, hp):
 
 # ---------------- 游戏对象 ----------------
 class Note:
+    __slots__ = ("x","lane_idx","y","speed","hit","missed","freq_idx")
     def __init__(self, x, lane_idx, y, speed, freq_idx):
         self.x = x; self.lane_idx = lane_idx; self.y = y
         self.speed = speed; self.hit = False; self.missed = False
@@ -110,6 +111,7 @@ class Note:
         pygame.draw.polygon(surf, color, pts)
 
 class Duck:
+    __slots__ = ("lanes","idx","y","mouth")
     def __init__(self, lane_ys):
         self.lanes = lane_ys
         self.idx = min(1, len(lane_ys)-1)
@@ -138,6 +140,7 @@ class Duck:
 
 # ---------------- 简单特效 ----------------
 class HitEffect:
+    __slots__ = ("x","y","t","dur")
     def __init__(self, x, y):
         self.x = x; self.y = y
         self.t = 0.0; self.dur = 0.28
@@ -156,6 +159,7 @@ class HitEffect:
         surf.blit(s, (int(self.x-r), int(self.y-r)))
 
 class TextPop:
+    __slots__ = ("x","y","t","dur","text","color")
     def __init__(self, x, y, text, color=(255,255,255)):
         self.x = x; self.y = y; self.t = 0.0; self.dur = 0.8; self.text = text; self.color = color
     def update(self, dt):
@@ -174,6 +178,7 @@ class TextPop:
         surf.blit(img, rect)
 
 class MissFlash:
+    __slots__ = ("t","dur")
     def __init__(self):
         self.t = 0.0; self.dur = 0.35
     def update(self, dt):
@@ -125,6 +125,7 @@ def draw_bg(surf, lanesY):
 
 # ---------- 对象 ----------
 class Note:
+    __slots__ = ("x","lane","y","hit","missed")
     def __init__(self, x, lane, y):
         self.x = x; self.lane = lane; self.y = y
         self.hit = False; self.missed = False
@@ -136,6 +137,7 @@ class Note:
         draw_pixel_star(surf, int(self.x), int(self.y), miss=self.missed)
 
 class Duck:
+    __slots__ = ("lanesY","idx","y","mouth")
     def __init__(self, lanesY):
         self.lanesY = lanesY
         self.idx = min(1, len(lanesY)-1)
@@ -169,6 +171,7 @@ def schedule_for(level):
 
 # ---------- Pixel 特效 (小尺寸像素风) ----------
 class PxHit:
+    __slots__ = ("x","y","t","dur")
     def __init__(self, x, y):
         self.x = int(x); self.y = int(y)
         self.t = 0.0; self.dur = 0.28
@@ -188,6 +191,7 @@ class PxHit:
                     px_rect(surf, self.x+dx, self.y+dy, 1, 1, (r, max(0,g), b))
 
 class PxText:
+    __slots__ = ("x","y","txt","color","t","dur")
     def __init__(self, x, y, txt, color=(255,255,255)):
         self.x = int(x); self.y = int(y); self.txt = txt; self.color = color
         self.t = 0.0; self.dur = 0.8
@@ -202,6 +206,7 @@ class PxText:
         px_text(surf, self.txt, self.x-6, self.y + yoff, self.color)
 
 class PxMissFlash:
+    __slots__ = ("t","dur")
     def __init__(self):
         self.t = 0.0; self.dur = 0.28
     def update(self, dt):
@@ -146,6 +146,7 @@ def draw_note(s, x,y, miss=False):
 
 # =============== Pixel 特效 (小像素效果) ===============
 class PxHit:
+    __slots__ = ("x","y","t","dur")
     def __init__(self, x, y):
         self.x = int(x); self.y = int(y)
         self.t = 0.0; self.dur = 0.28
@@ -164,6 +165,7 @@ class PxHit:
                     px_rect(s, self.x+dx, self.y+dy, 1, 1, (r, max(0,g), b))
 
 class PxText:
+    __slots__ = ("x","y","txt","color","t","dur")
     def __init__(self, x, y, txt, color=(255,255,255)):
         self.x = int(x); self.y = int(y); self.txt = txt; self.color = color
         self.t = 0.0; self.dur = 0.8
@@ -178,6 +180,7 @@ class PxText:
         px_text(s, self.txt, self.x-6, self.y + yoff, self.color)
 
 class PxMissFlash:
+    __slots__ = ("t","dur")
     def __init__(self):
         self.t = 0.0; self.dur = 0.28
     def update(self, dt):
@@ -194,6 +197,7 @@ class PxMissFlash:
 
 # =============== 游戏对象 ===============
 class Note:
+    __slots__ = ("x","lane","y","hit","missed")
     def __init__(self, x, lane, y):
         self.x=x; self.lane=lane; self.y=y
         self.hit=False; self.missed=False
@@ -204,6 +208,7 @@ class Note:
     def draw(self, s): draw_note(s, self.x, self.y, self.missed)
 
 class Duck:
+    __slots__ = ("lanes","idx","y","mouth")
     def __init__(self, laneYs):
         self.lanes=laneYs; self.idx=min(1,len(laneYs)-1)
         self.y=self.lanes[self.idx]; self.mouth=0.0